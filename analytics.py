@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from config import Config
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Шаг воронки: 0 — тест начат, N — отвечен N-й вопрос
+STEP_STARTED = 0
+
+class QuizAnalytics:
+    """
+    Аналитика прохождения теста: события копятся в памяти и пачкой
+    дописываются в quiz_events, одновременно обновляя счётчики воронки
+    и распределения ответов. Обработчики не ждут записи в БД.
+    """
+
+    def __init__(self, db: Database, flush_interval: float = 2.0, batch_size: int = 500, max_buffer: int = 50000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._events: List[Tuple[int, str, int, Optional[str], float]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def _append(self, user_id: int, event: str, step: int, option: Optional[str] = None):
+        if len(self._events) >= self.max_buffer:
+            # БД недоступна слишком долго — аналитика не должна съесть всю память
+            self.dropped += 1
+            return
+        self._events.append((user_id, event, step, option, time.time()))
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_start(self, user_id: int):
+        self._append(user_id, "start", STEP_STARTED)
+
+    def record_answer(self, user_id: int, question: int, option: str, new_step: bool):
+        """question — номер вопроса с 1; new_step — в этой попытке вопрос отвечен впервые"""
+        self._append(user_id, "answer" if new_step else "reanswer", question, option)
+
+    def record_back(self, user_id: int, question: int, option: str):
+        """Возврат к вопросу question: ответ option на него отменён"""
+        self._append(user_id, "back", question, option)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        options: Counter = Counter()
+        funnel: Counter = Counter()
+        for _, event, step, option, _ in events:
+            if event in ("answer", "reanswer"):
+                options[(step, option)] += 1
+            elif event == "back":
+                options[(step, option)] -= 1
+            if event in ("start", "answer"):
+                funnel[step] += 1
+        try:
+            await self.db.save_quiz_events(
+                events,
+                [(step, option, delta) for (step, option), delta in options.items() if delta],
+                list(funnel.items()),
+            )
+        except Exception as e:
+            logger.error(f"Ошибка записи аналитики ({len(events)} событий): {e}")
+            self._events[:0] = events[: self.max_buffer - len(self._events)]
+
+analytics = QuizAnalytics(Database(), flush_interval=Config.ANALYTICS_FLUSH_INTERVAL)
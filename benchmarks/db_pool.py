@@ -0,0 +1,105 @@
+"""
+Сравнение пула соединений с прежним подходом «новое соединение на каждый вызов».
+
+Запуск: python -m benchmarks.db_pool [количество_операций] [параллельность]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Бенчмарку не нужен настоящий бот — подставляем заглушки для Config
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "@benchmark")
+
+import aiosqlite  # noqa: E402
+
+from database import ConnectionPool  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        test_result TEXT,
+        test_completed_at TIMESTAMP,
+        answers TEXT
+    )
+'''
+INSERT = "INSERT OR IGNORE INTO users (id, username, first_name, last_name) VALUES (?, ?, ?, ?)"
+UPDATE = "UPDATE users SET test_result = ?, test_completed_at = CURRENT_TIMESTAMP, answers = ? WHERE id = ?"
+SELECT = "SELECT id, test_result FROM users WHERE id = ?"
+
+class ConnectPerCall:
+    """Старое поведение Database: aiosqlite.connect() на каждый запрос"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def write(self, sql: str, params: tuple):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(sql, params)
+            await db.commit()
+
+    async def read(self, sql: str, params: tuple):
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+class Pooled:
+    def __init__(self, path: str):
+        self.pool = ConnectionPool(path)
+
+    async def write(self, sql: str, params: tuple):
+        async with self.pool.write() as db:
+            await db.execute(sql, params)
+
+    async def read(self, sql: str, params: tuple):
+        async with self.pool.read() as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+async def user_flow(backend, user_id: int):
+    """Путь пользователя по БД: /start, проверка результата, завершение теста"""
+    await backend.write(INSERT, (user_id, "user", "Имя", ""))
+    await backend.read(SELECT, (user_id,))
+    await backend.write(UPDATE, ("A", "A,B,C,A,B,C,A,B", user_id))
+
+async def run(backend, operations: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(user_id: int):
+        async with semaphore:
+            await user_flow(backend, user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(operations)))
+    return time.perf_counter() - started
+
+async def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, factory in (("connect-per-call", ConnectPerCall), ("pool", Pooled)):
+            path = os.path.join(tmp, f"{name}.db")
+            async with aiosqlite.connect(path) as db:
+                await db.execute(SCHEMA)
+                await db.commit()
+            backend = factory(path)
+            results[name] = await run(backend, operations, concurrency)
+            if isinstance(backend, Pooled):
+                await backend.pool.close()
+
+    print(f"Пользователей: {operations}, параллельность: {concurrency}")
+    for name, elapsed in results.items():
+        print(f"{name:>18}: {elapsed:7.3f} с  ({operations * 3 / elapsed:9.0f} запросов/с)")
+    print(f"Ускорение: x{results['connect-per-call'] / results['pool']:.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+Локальная замена Bot API для нагрузочных тестов.
+
+Отвечает на методы, которые вызывает бот, правдоподобными объектами
+и считает вызовы. Бот подключается к ней через TELEGRAM_API_URL.
+"""
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+BOT_ID = 100000
+
+def _message(chat_id: int, message_id: int, text: str = "") -> Dict[str, Any]:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+        "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+        "text": text or "ok",
+    }
+
+class FakeBotAPI:
+    def __init__(self, member_status: str = "member", latency: float = 0.0):
+        self.member_status = member_status
+        # Искусственная задержка ответа — приближение к сетевому RTT до api.telegram.org
+        self.latency = latency
+        self.calls: Counter = Counter()
+        # chat_id -> время каждого сообщения/редактирования, отправленного ботом
+        self.replies: Dict[int, List[float]] = defaultdict(list)
+        self.webhook_url = ""
+        self.allowed_updates: List[str] = []
+        self._message_ids = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._waiters: List[tuple] = []
+        # chat_id -> [(номер ответа, future)] для wait_reply
+        self._chat_waiters: Dict[int, List[Tuple[int, asyncio.Future]]] = defaultdict(list)
+
+    def _next_message_id(self) -> int:
+        self._message_ids += 1
+        return self._message_ids
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items()}
+
+    def _reply(self, chat_id: int):
+        self.replies[chat_id].append(time.perf_counter())
+        chat_waiters = self._chat_waiters.get(chat_id)
+        if chat_waiters:
+            count = len(self.replies[chat_id])
+            for waiter in list(chat_waiters):
+                if waiter[0] <= count:
+                    if not waiter[1].done():
+                        waiter[1].set_result(None)
+                    chat_waiters.remove(waiter)
+        for waiter in list(self._waiters):
+            predicate, future = waiter
+            if not future.done() and predicate(self):
+                future.set_result(None)
+                self._waiters.remove(waiter)
+
+    async def wait_for(self, predicate: Callable[["FakeBotAPI"], bool], timeout: float):
+        """Ожидание, пока бот не сделает нужные вызовы"""
+        if predicate(self):
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        await asyncio.wait_for(future, timeout)
+
+    async def wait_reply(self, chat_id: int, count: int, timeout: float) -> float:
+        """Ожидание count-го ответа бота в чат; возвращает время этого ответа (perf_counter)"""
+        replies = self.replies[chat_id]
+        if len(replies) < count:
+            future = asyncio.get_running_loop().create_future()
+            self._chat_waiters[chat_id].append((count, future))
+            await asyncio.wait_for(future, timeout)
+        return replies[count - 1]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await self._params(request)
+        raw_chat_id = str(params.get("chat_id") or 0)
+        # chat_id канала может быть @username
+        chat_id = int(raw_chat_id) if raw_chat_id.lstrip("-").isdigit() else 0
+        result: Any = True
+
+        if method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Bot", "username": "fake_bot"}
+        elif method == "getChatMember":
+            user_id = int(params["user_id"])
+            result = {"status": self.member_status, "user": {"id": user_id, "is_bot": False, "first_name": "User"}}
+        elif method in ("sendMessage", "sendDocument"):
+            result = _message(chat_id, self._next_message_id(), params.get("text", ""))
+            self._reply(chat_id)
+        elif method == "editMessageText":
+            result = _message(chat_id, int(params.get("message_id") or 0), params.get("text", ""))
+            self._reply(chat_id)
+        elif method == "copyMessage":
+            result = {"message_id": self._next_message_id()}
+            self._reply(chat_id)
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            allowed = params.get("allowed_updates") or "[]"
+            self.allowed_updates = json.loads(allowed) if isinstance(allowed, str) else allowed
+        elif method == "getWebhookInfo":
+            result = {
+                "url": self.webhook_url,
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+                "allowed_updates": self.allowed_updates,
+            }
+        if self.latency:
+            # Сообщение «доставлено» сразу, бот же ждёт ответа как от удалённого сервера
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,261 @@
+"""
+Сквозной нагрузочный тест полного сценария пользователя.
+
+Запускает main.py против локального FakeBotAPI и прогоняет через webhook
+тысячи синтетических пользователей: /start → проверка подписки → начало
+теста → 8 ответов → результат. Каждый пользователь ждёт ответа бота
+на предыдущий шаг, как живой человек. Ответы выбираются генератором
+с фиксированным seed, БД создаётся заново — прогоны сравнимы между собой.
+
+Считает обновления в секунду, задержку «апдейт → ответ бота» (p50/p95/p99)
+и число вызовов Bot API на один пройденный тест. С --max-p95 / --min-rate
+завершается с кодом 1, если результат хуже порога (для поиска регрессий).
+
+Запуск: python -m benchmarks.quiz_load --users 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.fake_bot_api import BOT_ID, FakeBotAPI
+
+TOKEN = "123456:benchmark"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = 8
+OPTIONS = "ABC"
+# Вызовы при запуске бота — не относятся к пользователям
+STARTUP_METHODS = ("getMe", "deleteWebhook", "setWebhook", "getWebhookInfo")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} не ответил за {timeout} с")
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": "User"}
+
+def message_update(update_id: int, user_id: int, text: str) -> Dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "User"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id: int, user_id: int, message_id: int, data: str) -> Dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": "User"},
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+                "text": "...",
+            },
+        },
+    }
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+class LoadResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.updates = 0
+        self.completed = 0
+        self.failed = 0
+        # Результатов в БД после остановки бота: ответ мог прийти, а результат — потеряться
+        self.stored = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.api_calls: Counter = Counter()
+
+    @property
+    def rate(self) -> float:
+        return self.updates / self.elapsed if self.elapsed else 0.0
+
+    def p(self, q: float) -> float:
+        return percentile(self.latencies, q) * 1000
+
+class QuizLoad:
+    def __init__(self, webhook: str, api: FakeBotAPI, seed: int, step_timeout: float):
+        self.webhook = webhook
+        self.api = api
+        self.seed = seed
+        self.step_timeout = step_timeout
+        self.result = LoadResult()
+        self._update_ids = 0
+
+    def _next_update_id(self) -> int:
+        self._update_ids += 1
+        return self._update_ids
+
+    async def _post(self, session: aiohttp.ClientSession, update: Dict) -> bool:
+        # 503 — очередь бота переполнена, Telegram повторил бы доставку позже
+        for _ in range(50):
+            async with session.post(self.webhook, json=update) as response:
+                await response.read()
+                if response.status != 503:
+                    return response.status == 200
+            self.result.rejected += 1
+            await asyncio.sleep(0.1)
+        return False
+
+    async def _step(self, session: aiohttp.ClientSession, user_id: int, update: Dict, expected_replies: int):
+        sent_at = time.perf_counter()
+        if not await self._post(session, update):
+            raise RuntimeError(f"webhook не принял апдейт {update['update_id']}")
+        replied_at = await self.api.wait_reply(user_id, expected_replies, self.step_timeout)
+        self.result.updates += 1
+        self.result.latencies.append(replied_at - sent_at)
+
+    async def run_user(self, session: aiohttp.ClientSession, user_id: int):
+        # Свой генератор на пользователя: ответы не зависят от порядка запуска
+        rng = random.Random(self.seed * 1_000_003 + user_id)
+        answers = [rng.choice(OPTIONS) for _ in range(QUESTIONS)]
+        try:
+            await self._step(session, user_id, message_update(self._next_update_id(), user_id, "/start"), 1)
+            message_id = self._next_update_id()
+            await self._step(session, user_id, callback_update(message_id, user_id, message_id, "check_subscription"), 2)
+            await self._step(session, user_id, callback_update(self._next_update_id(), user_id, message_id, "start_test"), 3)
+            for q_index, option in enumerate(answers):
+                update = callback_update(self._next_update_id(), user_id, message_id, f"ans_{q_index}_{option}")
+                await self._step(session, user_id, update, 4 + q_index)
+            self.result.completed += 1
+        except (asyncio.TimeoutError, RuntimeError, aiohttp.ClientError) as e:
+            self.result.failed += 1
+            print(f"Пользователь {user_id} не прошёл тест: {e!r}")
+
+async def run(users: int, concurrency: int, seed: int, api_latency: float,
+              env_overrides: Optional[Dict[str, str]] = None, step_timeout: float = 30) -> LoadResult:
+    api = FakeBotAPI(latency=api_latency)
+    api_url = await api.start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            BOT_TOKEN=TOKEN,
+            ADMIN_ID="1",
+            CHANNEL_ID="@benchmark",
+            BASE_URL=f"http://127.0.0.1:{port}",
+            TELEGRAM_API_URL=api_url,
+            DB_PATH=os.path.join(tmp, "bench.db"),
+            WORKERS_STATE_DIR=os.path.join(tmp, "workers"),
+            PORT=str(port),
+            # Синтетические пользователи отвечают быстрее живых — лимит частоты не нужен
+            THROTTLE_ENABLED="0",
+        )
+        env.update(env_overrides or {})
+        bot = subprocess.Popen(
+            [sys.executable, "main.py"], cwd=ROOT, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            await wait_ready(f"http://127.0.0.1:{port}/ready", timeout=60)
+            startup_calls = Counter(api.calls)
+            load = QuizLoad(f"http://127.0.0.1:{port}/webhook/{TOKEN}", api, seed, step_timeout)
+            semaphore = asyncio.Semaphore(concurrency)
+            connector = aiohttp.TCPConnector(limit=concurrency)
+
+            async with aiohttp.ClientSession(connector=connector) as session:
+                async def simulate(user_id: int):
+                    async with semaphore:
+                        await load.run_user(session, user_id)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(simulate(2_000_000 + i) for i in range(users)))
+                load.result.elapsed = time.perf_counter() - started
+
+            load.result.api_calls = Counter(api.calls) - startup_calls
+            for method in STARTUP_METHODS:
+                load.result.api_calls.pop(method, None)
+        finally:
+            bot.terminate()
+            # Ждём в потоке: при остановке бот ещё обращается к FakeBotAPI в этом цикле
+            await asyncio.to_thread(bot.wait, 60)
+            await api.stop()
+        with sqlite3.connect(env["DB_PATH"]) as db:
+            load.result.stored = db.execute("SELECT COUNT(*) FROM users WHERE result_code IS NOT NULL").fetchone()[0]
+    return load.result
+
+def report(result: LoadResult):
+    completed = result.completed or 1
+    print(f"Пройдено тестов: {result.completed}, не пройдено: {result.failed}, 503 от бота: {result.rejected}")
+    print(f"Результатов в БД: {result.stored}")
+    print(f"Обновлений: {result.updates} за {result.elapsed:.2f} с — {result.rate:.0f} обновлений/с")
+    print(f"Задержка апдейт → ответ: p50 {result.p(50):.1f} мс, p95 {result.p(95):.1f} мс, p99 {result.p(99):.1f} мс")
+    print(f"Вызовов Bot API на пройденный тест: {sum(result.api_calls.values()) / completed:.2f}")
+    for method, count in result.api_calls.most_common():
+        print(f"  {method:<22} {count / completed:6.2f}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000, help="сколько пользователей проходят тест")
+    parser.add_argument("--concurrency", type=int, default=100, help="сколько пользователей активны одновременно")
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора ответов")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--workers", type=int, default=1, help="WEB_WORKERS бота")
+    parser.add_argument("--max-p95", type=float, help="порог p95, мс: хуже — код выхода 1")
+    parser.add_argument("--min-rate", type=float, help="порог обновлений/с: меньше — код выхода 1")
+    args = parser.parse_args()
+
+    print(f"Пользователей: {args.users}, одновременно: {args.concurrency}, "
+          f"воркеров: {args.workers}, задержка API: {args.api_latency * 1000:.0f} мс, ядер: {os.cpu_count()}")
+    result = await run(
+        args.users, args.concurrency, args.seed, args.api_latency,
+        env_overrides={"WEB_WORKERS": str(args.workers)},
+    )
+    report(result)
+
+    regressions = []
+    if result.failed:
+        regressions.append(f"не пройдено тестов: {result.failed}")
+    if result.stored < result.completed:
+        regressions.append(f"в БД нет результатов: {result.completed - result.stored}")
+    if args.max_p95 is not None and result.p(95) > args.max_p95:
+        regressions.append(f"p95 {result.p(95):.1f} мс > {args.max_p95} мс")
+    if args.min_rate is not None and result.rate < args.min_rate:
+        regressions.append(f"{result.rate:.0f} обновлений/с < {args.min_rate}")
+    if regressions:
+        print("❌ Регрессия: " + "; ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Нагрузочный тест режима нескольких воркеров (SO_REUSEPORT).
+
+Для каждого числа воркеров прогоняет полный сценарий benchmarks.quiz_load:
+пользователи проходят тест целиком, а шаги одного пользователя попадают
+в разные процессы. Считает, сколько обновлений в секунду обрабатывает бот,
+и завершается с кодом 1, если хоть один тест не дошёл до результата.
+
+Запуск: python -m benchmarks.webhook_load [пользователей] [параллельность] [воркеры через запятую]
+"""
+import asyncio
+import os
+import sys
+
+from benchmarks.quiz_load import run
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    worker_counts = [int(n) for n in (sys.argv[3] if len(sys.argv) > 3 else "1,2,4").split(",")]
+
+    print(f"Пользователей: {users}, параллельность: {concurrency}, ядер: {os.cpu_count()}")
+    baseline = None
+    unfinished = 0
+    for workers in worker_counts:
+        result = await run(users, concurrency, seed=1, api_latency=0.0,
+                           env_overrides={"WEB_WORKERS": str(workers)})
+        baseline = baseline or result.rate
+        lost = result.failed + max(0, result.completed - result.stored)
+        unfinished += lost
+        print(f"воркеров: {workers:>2}  {result.rate:8.0f} обновлений/с  (x{result.rate / baseline:.2f})  "
+              f"не пройдено: {lost}")
+
+    if unfinished:
+        print(f"❌ Не пройдено тестов: {unfinished}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
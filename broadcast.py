@@ -0,0 +1,412 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiogram import Bot
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import Config
+from database import Database
+from texts.admin import ADMIN_BROADCAST_ABANDONED, ADMIN_BROADCAST_PROGRESS, ADMIN_BROADCAST_COMPLETE
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых писать в чат бессмысленно
+PERMANENT_ERROR_MARKERS = (
+    "chat not found",
+    "user is deactivated",
+    "bot was blocked",
+    "bot was kicked",
+    "bot can't initiate conversation",
+    "peer_id_invalid",
+)
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: rate токенов в секунду, запас до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Пауза для всех отправителей (после TelegramRetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    success: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.success + self.blocked + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+def is_permanent_error(error: Exception) -> bool:
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        text = str(error).lower()
+        return any(marker in text for marker in PERMANENT_ERROR_MARKERS)
+    return False
+
+class BroadcastEngine:
+    """
+    Рассылка пулом из concurrency отправителей с общим TokenBucket.
+    Соблюдает retry_after, повторяет временные ошибки, отделяет заблокировавших бота.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int], Awaitable[object]],
+        rate: float = 25,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        progress_interval: float = 5.0,
+        stats: Optional[BroadcastStats] = None,
+    ):
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        # Готовая статистика передаётся при продолжении рассылки — total уже известен
+        self._count_total = stats is None
+        self.stats = stats or BroadcastStats()
+
+    async def _deliver(self, chat_id: int) -> str:
+        """Отправка одному получателю: 'success', 'blocked' или 'failed'"""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.send(chat_id)
+                return "success"
+            except TelegramRetryAfter as e:
+                # Флуд-контроль общий для бота — притормаживаем всех
+                self.stats.flood_waits += 1
+                self.bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.warning(f"Не удалось отправить {chat_id} после {attempt} попыток: {e}", extra={"user_id": chat_id})
+                    return "failed"
+                self.stats.retries += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                if is_permanent_error(e):
+                    return "blocked"
+                logger.warning(f"Не удалось отправить {chat_id}: {e}", extra={"user_id": chat_id})
+                return "failed"
+
+    async def _worker(self, queue: asyncio.Queue, on_result: Optional[Callable[[int, str], Awaitable[None]]]):
+        while True:
+            chat_id = await queue.get()
+            try:
+                status = await self._deliver(chat_id)
+                setattr(self.stats, status, getattr(self.stats, status) + 1)
+                if on_result is not None:
+                    await on_result(chat_id, status)
+            except Exception as e:
+                logger.error(f"Ошибка обработки получателя {chat_id}: {e}", extra={"user_id": chat_id})
+            finally:
+                queue.task_done()
+
+    async def _report_progress(self, on_progress: Callable[[BroadcastStats], Awaitable[None]]):
+        last_done = -1
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if self.stats.done != last_done:
+                last_done = self.stats.done
+                try:
+                    await on_progress(self.stats)
+                except Exception as e:
+                    logger.error(f"Ошибка обновления прогресса рассылки: {e}")
+
+    async def _enqueue(self, queue: asyncio.Queue, chat_id: int):
+        if self._count_total:
+            self.stats.total += 1
+        await queue.put(chat_id)
+
+    async def run(
+        self,
+        chat_ids: Union[Iterable[int], AsyncIterator[int]],
+        on_progress: Optional[Callable[[BroadcastStats], Awaitable[None]]] = None,
+        on_result: Optional[Callable[[int, str], Awaitable[None]]] = None,
+    ) -> BroadcastStats:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        workers = [asyncio.create_task(self._worker(queue, on_result)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._report_progress(on_progress)) if on_progress else None
+        try:
+            if hasattr(chat_ids, "__aiter__"):
+                async for chat_id in chat_ids:
+                    await self._enqueue(queue, chat_id)
+            else:
+                for chat_id in chat_ids:
+                    await self._enqueue(queue, chat_id)
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+            await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+        return self.stats
+
+def format_broadcast_stats(template: str, stats: BroadcastStats) -> str:
+    return template.format(
+        done=stats.done,
+        total=stats.total,
+        success=stats.success,
+        blocked=stats.blocked,
+        failed=stats.failed,
+        elapsed=int(stats.elapsed)
+    )
+
+class BroadcastManager:
+    """
+    Задачи рассылки, сохранённые в SQLite: у каждого получателя свой статус,
+    рассылка идёт фоновой задачей и продолжается после перезапуска бота.
+    Задачу выполняет процесс, который её захватил (owner), и раз в
+    heartbeat_interval продлевает владение. Лидер периодически подбирает
+    задачи без живого владельца — в том числе от упавшего воркера.
+    """
+
+    def __init__(self, db: Database, chunk_size: int = 500, flush_every: int = 50,
+                 heartbeat_interval: float = 10.0):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.flush_every = flush_every
+        # Не чаще раза в секунду: каждая отметка — запись в БД
+        self.heartbeat_interval = max(1.0, heartbeat_interval)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._engines: Dict[int, BroadcastEngine] = {}
+        self._recovery_task: Optional[asyncio.Task] = None
+
+    @property
+    def owner(self) -> str:
+        # pid, а не значение из __init__: менеджер создаётся до fork воркеров
+        return str(os.getpid())
+
+    def _stale_before(self) -> float:
+        """Владелец, не отмечавшийся с этого момента, считается пропавшим"""
+        return time.time() - 3 * self.heartbeat_interval
+
+    def is_running(self, job_id: int) -> bool:
+        return job_id in self._tasks
+
+    def live_stats(self, job_id: int) -> Optional[BroadcastStats]:
+        engine = self._engines.get(job_id)
+        return engine.stats if engine else None
+
+    def start(self, bot: Bot, job_id: int):
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run_job(bot, job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def recover(self, bot: Bot) -> List[int]:
+        """
+        Отмена задач, зависших в preparing, и запуск идущих рассылок без
+        живого владельца. Возвращает id рассылок, запущенных здесь
+        """
+        stale_before = self._stale_before()
+        for job_id, status_chat_id, status_message_id in await self.db.abandon_stale_broadcast_jobs(stale_before):
+            logger.warning(f"Рассылка #{job_id} отменена: список получателей не был собран")
+            if status_chat_id:
+                try:
+                    await bot.edit_message_text(
+                        ADMIN_BROADCAST_ABANDONED.format(job_id=job_id),
+                        chat_id=status_chat_id,
+                        message_id=status_message_id
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка обновления статуса рассылки #{job_id}: {e}")
+        job_ids = [job_id for job_id in await self.db.get_orphaned_broadcast_jobs(stale_before)
+                   if job_id not in self._tasks]
+        for job_id in job_ids:
+            self.start(bot, job_id)
+        return job_ids
+
+    def start_recovery(self, bot: Bot):
+        """Периодический recover; запускается один раз на все воркеры"""
+        if self._recovery_task is None or self._recovery_task.done():
+            self._recovery_task = asyncio.create_task(self._recover_forever(bot))
+
+    async def _recover_forever(self, bot: Bot):
+        while True:
+            try:
+                resumed = await self.recover(bot)
+                if resumed:
+                    logger.info(f"📧 Продолжены рассылки: {resumed}")
+            except Exception as e:
+                logger.error(f"Ошибка проверки зависших рассылок: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отмена рассылки: неотправленные получатели так и останутся pending"""
+        job = await self.db.get_broadcast_job(job_id)
+        if job is None or job[5] != "running":
+            return False
+        await self.db.finish_broadcast_job(job_id, "cancelled")
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def shutdown(self):
+        """
+        Остановка при выключении бота: задачи остаются running, владение
+        снимается, и лидер продолжит их, не дожидаясь устаревания heartbeat
+        """
+        tasks = list(self._tasks.values())
+        if self._recovery_task is not None:
+            tasks.append(self._recovery_task)
+            self._recovery_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self.db.release_broadcast_jobs(self.owner)
+        except Exception as e:
+            logger.error(f"Ошибка освобождения рассылок: {e}")
+
+    async def _recipients(self, job_id: int) -> AsyncIterator[int]:
+        after_user_id = 0
+        while True:
+            chunk = await self.db.get_pending_recipients(job_id, after_user_id, self.chunk_size)
+            if not chunk:
+                return
+            for user_id in chunk:
+                yield user_id
+            after_user_id = chunk[-1]
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                owned = await self.db.touch_broadcast_job(job_id, self.owner)
+            except Exception as e:
+                logger.error(f"Ошибка продления рассылки #{job_id}: {e}")
+                continue
+            if not owned:
+                # Отменена через другой воркер или перехвачена после долгой паузы
+                task = self._tasks.get(job_id)
+                if task is not None:
+                    task.cancel()
+                return
+
+    async def _run_job(self, bot: Bot, job_id: int):
+        # Рассылку мог уже захватить другой воркер
+        if not await self.db.claim_broadcast_job(job_id, self.owner, self._stale_before()):
+            return
+        job = await self.db.get_broadcast_job(job_id)
+        if job is None:
+            return
+        _, from_chat_id, message_id, status_chat_id, status_message_id = job[:5]
+        counts = await self.db.get_broadcast_counts(job_id)
+        stats = BroadcastStats(
+            total=sum(counts.values()),
+            success=counts.get("success", 0),
+            blocked=counts.get("blocked", 0),
+            failed=counts.get("failed", 0),
+        )
+        results: List[Tuple[int, str]] = []
+
+        async def flush_results():
+            batch = results[:]
+            results.clear()
+            await self.db.save_broadcast_results(job_id, batch)
+
+        async def on_result(chat_id: int, status: str):
+            results.append((chat_id, status))
+            if len(results) >= self.flush_every:
+                await flush_results()
+
+        async def send(chat_id: int):
+            await bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+
+        async def show_status(template: str, stats: BroadcastStats):
+            if status_chat_id:
+                await bot.edit_message_text(
+                    format_broadcast_stats(template, stats),
+                    chat_id=status_chat_id,
+                    message_id=status_message_id
+                )
+
+        async def show_progress(stats: BroadcastStats):
+            await flush_results()
+            # Отмена могла прийти через другой воркер — она видна только в БД
+            job = await self.db.get_broadcast_job(job_id)
+            if job is None or job[5] != "running":
+                task = self._tasks.get(job_id)
+                if task is not None:
+                    task.cancel()
+                return
+            await show_status(ADMIN_BROADCAST_PROGRESS, stats)
+
+        engine = BroadcastEngine(
+            send,
+            rate=Config.BROADCAST_RATE,
+            concurrency=Config.BROADCAST_CONCURRENCY,
+            max_retries=Config.BROADCAST_MAX_RETRIES,
+            progress_interval=Config.BROADCAST_PROGRESS_INTERVAL,
+            stats=stats,
+        )
+        self._engines[job_id] = engine
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await engine.run(self._recipients(job_id), on_progress=show_progress, on_result=on_result)
+        finally:
+            heartbeat.cancel()
+            # Сохраняем статусы даже при отмене, чтобы не отправить повторно
+            await flush_results()
+            self._engines.pop(job_id, None)
+        await self.db.finish_broadcast_job(job_id, "done")
+        try:
+            await show_status(ADMIN_BROADCAST_COMPLETE, stats)
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса рассылки #{job_id}: {e}")
+
+broadcast_manager = BroadcastManager(Database(), heartbeat_interval=Config.BROADCAST_HEARTBEAT_INTERVAL)
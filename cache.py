@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class TTLCache:
+    """
+    LRU-кэш с отдельными TTL для положительных и отрицательных значений.
+    Одновременные запросы одного ключа объединяются в один вызов loader,
+    при ошибке loader отдаётся устаревшее значение (если оно не старше stale_ttl).
+    """
+
+    def __init__(self, max_size: int, positive_ttl: float, negative_ttl: float, stale_ttl: float):
+        self.max_size = max(1, max_size)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Счётчики для /diag
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_served = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_fresh(self, value: Any, stored_at: float, now: float) -> bool:
+        ttl = self.positive_ttl if value else self.negative_ttl
+        return now - stored_at < ttl
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]], bypass_negative: bool = False) -> Any:
+        """
+        Значение из кэша или из loader.
+        bypass_negative — не доверять закэшированному отрицательному значению
+        (например, пользователь только что нажал «Проверить подписку»).
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            if self._is_fresh(value, stored_at, time.monotonic()) and not (bypass_negative and not value):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            self.errors += 1
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.stale_ttl:
+                self.stale_served += 1
+                future.set_result(entry[0])
+                return entry[0]
+            future.set_exception(e)
+            # Исключение получат ожидающие; помечаем, чтобы не было предупреждения
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "errors": self.errors,
+            "evictions": self.evictions,
+        }
@@ -11,6 +11,105 @@ class Config:
     CHANNEL_ID = os.getenv("CHANNEL_ID", "")
     CHANNEL_INVITE_LINK = os.getenv("CHANNEL_INVITE_LINK", "")
     DB_PATH = os.getenv("DB_PATH", "users.db")
+    # Свой Bot API сервер вместо api.telegram.org (пусто — официальный)
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+    # Количество процессов, слушающих один порт через SO_REUSEPORT
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+    # Папка для heartbeat-файлов воркеров и лока лидера (пусто — во временной папке)
+    WORKERS_STATE_DIR = os.getenv("WORKERS_STATE_DIR", "")
+    # Планировщик апдейтов (UPDATE_SCHEDULER=1): webhook отвечает сразу, апдейты
+    # обрабатывает пул задач, апдейты одного пользователя — строго по очереди.
+    # При переполнении очереди Telegram получает 503 и повторит доставку позже
+    UPDATE_SCHEDULER = os.getenv("UPDATE_SCHEDULER", "0") == "1"
+    UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+    # Отбрасывание повторов: update_id помним DEDUP_WINDOW секунд,
+    # повторное нажатие той же кнопки — DEDUP_CALLBACK_WINDOW секунд
+    DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "60"))
+    DEDUP_CALLBACK_WINDOW = float(os.getenv("DEDUP_CALLBACK_WINDOW", "3"))
+    DEDUP_MAX_KEYS = int(os.getenv("DEDUP_MAX_KEYS", "100000"))
+    # Ограничение частоты на пользователя: токенов в секунду и размер корзины.
+    # Отдельно сообщения, ответы в тесте, «Проверить подписку» и прочие кнопки.
+    # Скорость 0 — без ограничения для этого вида
+    THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") == "1"
+    THROTTLE_MESSAGE_RATE = float(os.getenv("THROTTLE_MESSAGE_RATE", "1"))
+    THROTTLE_MESSAGE_BURST = float(os.getenv("THROTTLE_MESSAGE_BURST", "5"))
+    THROTTLE_ANSWER_RATE = float(os.getenv("THROTTLE_ANSWER_RATE", "3"))
+    THROTTLE_ANSWER_BURST = float(os.getenv("THROTTLE_ANSWER_BURST", "10"))
+    THROTTLE_SUBSCRIPTION_RATE = float(os.getenv("THROTTLE_SUBSCRIPTION_RATE", "0.2"))
+    THROTTLE_SUBSCRIPTION_BURST = float(os.getenv("THROTTLE_SUBSCRIPTION_BURST", "3"))
+    THROTTLE_CALLBACK_RATE = float(os.getenv("THROTTLE_CALLBACK_RATE", "2"))
+    THROTTLE_CALLBACK_BURST = float(os.getenv("THROTTLE_CALLBACK_BURST", "5"))
+    THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "100000"))
+    DB_READERS = int(os.getenv("DB_READERS", "4"))
+    DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "128"))
+    # Отложенная запись (write-behind): 1 — включить
+    DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+    DB_FLUSH_INTERVAL_MS = int(os.getenv("DB_FLUSH_INTERVAL_MS", "50"))
+    DB_FLUSH_BATCH = int(os.getenv("DB_FLUSH_BATCH", "200"))
+    DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000"))
+    # Фоновая конвертация старых строк после миграций: размер пачки и пауза между пачками (секунды)
+    DB_BACKFILL_BATCH = int(os.getenv("DB_BACKFILL_BATCH", "500"))
+    DB_BACKFILL_PAUSE = float(os.getenv("DB_BACKFILL_PAUSE", "0.05"))
+    # Реплика для запросов админки и аналитики: 1 — включить. Снимок раз в DB_REPLICA_INTERVAL секунд
+    # порциями по DB_REPLICA_PAGES страниц с паузой DB_REPLICA_STEP_PAUSE; снимок старше
+    # DB_REPLICA_MAX_LAG секунд не используется — запросы идут в основную базу
+    DB_REPLICA = os.getenv("DB_REPLICA", "0") == "1"
+    DB_REPLICA_PATH = os.getenv("DB_REPLICA_PATH", "")
+    DB_REPLICA_INTERVAL = float(os.getenv("DB_REPLICA_INTERVAL", "60"))
+    DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "300"))
+    DB_REPLICA_PAGES = int(os.getenv("DB_REPLICA_PAGES", "256"))
+    DB_REPLICA_STEP_PAUSE = float(os.getenv("DB_REPLICA_STEP_PAUSE", "0.005"))
+    # Кэш проверки подписки (секунды)
+    SUB_CACHE_SIZE = int(os.getenv("SUB_CACHE_SIZE", "50000"))
+    SUB_CACHE_POSITIVE_TTL = float(os.getenv("SUB_CACHE_POSITIVE_TTL", "300"))
+    SUB_CACHE_NEGATIVE_TTL = float(os.getenv("SUB_CACHE_NEGATIVE_TTL", "15"))
+    SUB_CACHE_STALE_TTL = float(os.getenv("SUB_CACHE_STALE_TTL", "3600"))
+    # Зеркало подписок в SQLite: сколько доверять записи (секунды) и таймаут запроса к API.
+    # Сверка раз в MEMBERSHIP_RECONCILE_INTERVAL перепроверяет записи старше половины срока
+    # не быстрее MEMBERSHIP_RECONCILE_RATE запросов в секунду; 0 в любом из них выключает сверку
+    MEMBERSHIP_MAX_AGE = float(os.getenv("MEMBERSHIP_MAX_AGE", "86400"))
+    SUBSCRIPTION_API_TIMEOUT = int(os.getenv("SUBSCRIPTION_API_TIMEOUT", "5"))
+    MEMBERSHIP_RECONCILE_INTERVAL = float(os.getenv("MEMBERSHIP_RECONCILE_INTERVAL", "300"))
+    MEMBERSHIP_RECONCILE_BATCH = int(os.getenv("MEMBERSHIP_RECONCILE_BATCH", "100"))
+    MEMBERSHIP_RECONCILE_RATE = float(os.getenv("MEMBERSHIP_RECONCILE_RATE", "2"))
+    # FSM в SQLite: сессии без изменений дольше FSM_IDLE_TTL секунд удаляются
+    FSM_IDLE_TTL = float(os.getenv("FSM_IDLE_TTL", "86400"))
+    # Сколько FSM-записей держать в памяти (давно не использованные вытесняются)
+    FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "100000"))
+    # Аналитика теста: как часто события сбрасываются в БД (секунды)
+    ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+    # Уведомления админу: всплески собираются в сводки за окно (секунды)
+    ADMIN_DIGEST_WINDOW = float(os.getenv("ADMIN_DIGEST_WINDOW", "10"))
+    ADMIN_DIGEST_MAX_ITEMS = int(os.getenv("ADMIN_DIGEST_MAX_ITEMS", "25"))
+    # Выгрузка /export: строк за один запрос к БД и сколько байт держать в памяти до сброса на диск
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+    EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(1024 * 1024)))
+    # Логи: json или text; записи идут через очередь и пишутся в stderr фоновым потоком.
+    # Одинаковые предупреждения и ошибки: за LOG_SAMPLE_WINDOW секунд пишутся первые LOG_SAMPLE_BURST
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+    LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+    # Профилирование по HTTP (/debug/profile, /debug/slow): пусто — маршруты выключены.
+    # PROFILE_SLOW_CALLBACK — с какой длительности шаг цикла событий считается медленным (секунды)
+    PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+    PROFILE_SLOW_CALLBACK = float(os.getenv("PROFILE_SLOW_CALLBACK", "0.1"))
+    # Подсчёт результата: JSON с весами вариантов и порядком при ничьей (пусто — большинство, A > B > C)
+    SCORING_CONFIG = os.getenv("SCORING_CONFIG", "")
+    RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "5000"))
+    # Рассылка: лимит Bot API ~30 сообщений/с, берём с запасом
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+    BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+    BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+    # Сколько получателей добавляется в список рассылки одной транзакцией
+    BROADCAST_RECIPIENTS_BATCH = int(os.getenv("BROADCAST_RECIPIENTS_BATCH", "1000"))
+    # Воркер с рассылкой отмечается в БД раз в BROADCAST_HEARTBEAT_INTERVAL секунд.
+    # С той же частотой лидер подбирает рассылки, владелец которых не отмечался
+    # три интервала, и отменяет задачи, зависшие при сборе получателей
+    BROADCAST_HEARTBEAT_INTERVAL = float(os.getenv("BROADCAST_HEARTBEAT_INTERVAL", "10"))
     
     # Валидация
     if not BOT_TOKEN:
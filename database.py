@@ -1,63 +1,1223 @@
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import time
+import urllib.parse
 import aiosqlite
-from datetime import datetime
-from typing import List, Optional, Tuple
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from config import Config
+from metrics import DB_QUERY_SECONDS, DB_QUERY_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Настройки, которые применяются к каждому соединению
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+)
+
+def instrumented(func):
+    """Время и ошибки запроса — в метрики db_query_* с именем метода"""
+    timing = DB_QUERY_SECONDS.labels(func.__name__)
+    errors = DB_QUERY_ERRORS.labels(func.__name__)
+    
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            timing.observe(time.perf_counter() - started)
+    return wrapper
+
+# Числовые коды вариантов ответа (и результата теста); 0 — нет ответа
+ANSWER_CODES = {"A": 1, "B": 2, "C": 3}
+ANSWER_LETTERS = {code: letter for letter, code in ANSWER_CODES.items()}
+ANSWER_BITS = 2
+ANSWER_MASK = (1 << ANSWER_BITS) - 1
+
+def encode_answers(answers: List[str]) -> int:
+    """Ответы в одно число: по 2 бита на вопрос, первый вопрос — в младших битах"""
+    packed = 0
+    for i, answer in enumerate(answers):
+        packed |= ANSWER_CODES[answer] << (ANSWER_BITS * i)
+    return packed
+
+def decode_answers(packed: Optional[int], legacy: Optional[str] = None) -> List[str]:
+    """Обратно в список букв; legacy — текст из строк, которые ещё не сконвертированы"""
+    if packed is None:
+        return _parse_answers_text(legacy)
+    answers = []
+    while packed:
+        answers.append(ANSWER_LETTERS[packed & ANSWER_MASK])
+        packed >>= ANSWER_BITS
+    return answers
+
+def encode_result(result: Optional[str]) -> Optional[int]:
+    return ANSWER_CODES.get(result)
+
+def decode_result(code: Optional[int], legacy: Optional[str] = None) -> Optional[str]:
+    return ANSWER_LETTERS.get(code, legacy)
+
+def _parse_answers_text(text: Optional[str]) -> List[str]:
+    # Формат до миграции 2: "A,B,C"
+    return [answer for answer in (text or "").split(",") if answer in ANSWER_CODES]
+
+class ConnectionPool:
+    """
+    Долгоживущие соединения с SQLite: один писатель и несколько читателей.
+    Открываются один раз и живут до закрытия бота.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, cached_statements: int = 128):
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self.cached_statements = cached_statements
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        # cached_statements — кэш подготовленных выражений внутри sqlite3
+        conn = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def open(self):
+        """Открытие писателя и пула читателей"""
+        async with self._open_lock:
+            if self.is_open:
+                return
+            # Писатель открывается первым, чтобы включить WAL до читателей
+            writer = await self._connect()
+            readers = [await self._connect(read_only=True) for _ in range(self.readers_count)]
+            self._idle_readers = asyncio.Queue()
+            for conn in readers:
+                self._idle_readers.put_nowait(conn)
+            self._readers = readers
+            self._writer = writer
+
+    async def close(self):
+        """Закрытие всех соединений"""
+        async with self._open_lock:
+            if not self.is_open:
+                return
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for conn in self._readers:
+                await conn.close()
+            self._readers = []
+            self._idle_readers = None
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение-писатель: одна транзакция, commit при успехе, rollback при ошибке"""
+        if not self.is_open:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Свободное соединение-читатель из пула"""
+        if not self.is_open:
+            await self.open()
+        queue = self._idle_readers
+        conn = await queue.get()
+        try:
+            yield conn
+        finally:
+            queue.put_nowait(conn)
+
+class WriteBehindQueue:
+    """
+    Отложенная запись: запросы копятся в памяти и сбрасываются одной транзакцией
+    раз в interval_ms или при накоплении batch_size строк.
+    """
+
+    def __init__(self, pool: ConnectionPool, interval_ms: int = 50, batch_size: int = 200, max_size: int = 10000):
+        self.pool = pool
+        self.interval = interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._batch_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Счётчики для /diag
+        self.enqueued = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.failed_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, sql: str, params: Tuple[Any, ...]):
+        """Постановка записи в очередь; при переполнении ждёт (backpressure)"""
+        await self._queue.put((sql, params))
+        self.enqueued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_full.set()
+
+    async def stop(self):
+        """Остановка с гарантированным сбросом всего, что лежит в очереди"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._batch_full.set()
+        try:
+            # Будим сборщик, если он ждёт первую запись
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            batch = [] if item is None else [item]
+            if not self._stopping and self._queue.qsize() + 1 < self.batch_size:
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is not None:
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+            if self._stopping and self._queue.empty():
+                return
+
+    @instrumented
+    async def _flush(self, batch: List[Tuple[str, Tuple[Any, ...]]]):
+        started = time.perf_counter()
+        try:
+            async with self.pool.write() as db:
+                for sql, params in batch:
+                    await db.execute(sql, params)
+        except Exception as e:
+            # Одна плохая строка не должна терять всю пачку: пишем по одной
+            logger.warning(f"Ошибка пакетной записи ({len(batch)} строк), повтор по одной: {e}")
+            for sql, params in batch:
+                try:
+                    async with self.pool.write() as db:
+                        await db.execute(sql, params)
+                except Exception as row_error:
+                    self.failed_rows += 1
+                    logger.error(f"Не удалось записать {params}: {row_error}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.rows_flushed += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "failed_rows": self.failed_rows,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }
+
+class _SnapshotRestarted(Exception):
+    """Основную базу слишком часто меняют во время снимка"""
+
+class SnapshotReplica:
+    """
+    Копия базы только для чтения для тяжёлых запросов админки и аналитики.
+    Снимок снимается online backup API по pages страниц за шаг с паузой между
+    шагами, поэтому чтение основной базы нигде не длится долго. Если базу
+    изменяют во время копирования, SQLite начинает копию заново; после
+    max_restarts повторов остаток копируется одним шагом. В WAL такое чтение
+    не блокирует запись, а только откладывает checkpoint.
+    Готовая копия переводится в обычный журнал и через os.replace атомарно
+    заменяет предыдущую. Читатель открыт с immutable=1 и видит целый снимок
+    до следующей замены. Время снимка хранится в mtime файла, поэтому
+    возраст реплики видят все воркеры; снимает её только лидер.
+    """
+
+    def __init__(self, pool: ConnectionPool, path: str, interval: float = 60.0, max_lag: float = 300.0,
+                 pages: int = 256, pause: float = 0.005, max_restarts: int = 3):
+        self.pool = pool
+        self.path = path
+        self.interval = interval
+        self.max_lag = max_lag
+        self.pages = max(1, pages)
+        self.pause = pause
+        self.max_restarts = max_restarts
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._conn_inode: Optional[int] = None
+        self._lock = asyncio.Lock()
+        self._snapshot_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Счётчики для /diag
+        self.snapshots = 0
+        self.restarts = 0
+        self.last_snapshot_ms = 0.0
+        self.replica_reads = 0
+        self.fallbacks = 0
+
+    def age(self) -> Optional[float]:
+        """Возраст снимка в секундах; None — снимка ещё нет"""
+        try:
+            return max(0.0, time.time() - os.stat(self.path).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    def _copy(self) -> int:
+        """Снимок во временный файл и замена реплики; возвращает число повторов копирования"""
+        started = time.time()
+        tmp_path = f"{self.path}.tmp"
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(tmp_path + suffix):
+                os.remove(tmp_path + suffix)
+        source = sqlite3.connect(self.pool.db_path)
+        target = sqlite3.connect(tmp_path)
+        restarts = 0
+        remaining_before: Optional[int] = None
+
+        def progress(status: int, remaining: int, total: int):
+            nonlocal restarts, remaining_before
+            # Осталось больше, чем на прошлом шаге, — копирование началось заново
+            if remaining_before is not None and remaining > remaining_before:
+                restarts += 1
+                if restarts >= self.max_restarts:
+                    raise _SnapshotRestarted()
+            remaining_before = remaining
+            time.sleep(self.pause)
+
+        try:
+            source.execute("PRAGMA query_only = ON")
+            try:
+                source.backup(target, pages=self.pages, progress=progress)
+            except _SnapshotRestarted:
+                source.backup(target)
+            # Копия унаследовала WAL от основной базы: реплике нужен один файл
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, self.path)
+        return restarts
+
+    async def snapshot(self):
+        """Новый снимок основной базы (копирование — в отдельном потоке)"""
+        async with self._snapshot_lock:
+            started = time.perf_counter()
+            self.restarts += await asyncio.to_thread(self._copy)
+            self.snapshots += 1
+            self.last_snapshot_ms = (time.perf_counter() - started) * 1000
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error(f"Ошибка снимка реплики: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        async with self._lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+                self._conn_inode = None
+
+    async def _connection(self) -> Optional[aiosqlite.Connection]:
+        """Соединение с текущим снимком или None, если снимка нет или он устарел"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_lag:
+            return None
+        if self._conn is not None and self._conn_inode == stat.st_ino:
+            return self._conn
+        # Файл заменён новым снимком — переоткрываемся на него
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        try:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro&immutable=1"
+            self._conn = await aiosqlite.connect(uri, uri=True, cached_statements=self.pool.cached_statements)
+        except Exception as e:
+            logger.warning(f"Реплика недоступна, чтение из основной базы: {e}")
+            return None
+        self._conn_inode = stat.st_ino
+        return self._conn
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение с репликой, если она свежая, иначе читатель основной базы"""
+        async with self._lock:
+            conn = await self._connection()
+            if conn is not None:
+                self.replica_reads += 1
+                yield conn
+                return
+        self.fallbacks += 1
+        async with self.pool.read() as db:
+            yield db
+
+    def stats(self) -> Dict[str, float]:
+        age = self.age()
+        return {
+            "age": age if age is not None else -1.0,
+            "max_lag": self.max_lag,
+            "snapshots": self.snapshots,
+            "restarts": self.restarts,
+            "last_snapshot_ms": self.last_snapshot_ms,
+            "replica_reads": self.replica_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+# Один пул, одна очередь и одна реплика на файл БД: Database создаётся в нескольких модулях
+_pools: Dict[str, ConnectionPool] = {}
+_write_queues: Dict[str, WriteBehindQueue] = {}
+_replicas: Dict[str, SnapshotReplica] = {}
+
+def get_pool(db_path: str) -> ConnectionPool:
+    pool = _pools.get(db_path)
+    if pool is None:
+        pool = ConnectionPool(db_path, readers=Config.DB_READERS, cached_statements=Config.DB_CACHED_STATEMENTS)
+        _pools[db_path] = pool
+    return pool
+
+def get_write_queue(db_path: str) -> WriteBehindQueue:
+    queue = _write_queues.get(db_path)
+    if queue is None:
+        queue = WriteBehindQueue(
+            get_pool(db_path),
+            interval_ms=Config.DB_FLUSH_INTERVAL_MS,
+            batch_size=Config.DB_FLUSH_BATCH,
+            max_size=Config.DB_WRITE_QUEUE_SIZE,
+        )
+        _write_queues[db_path] = queue
+    return queue
+
+def get_replica(db_path: str) -> SnapshotReplica:
+    replica = _replicas.get(db_path)
+    if replica is None:
+        replica = SnapshotReplica(
+            get_pool(db_path),
+            Config.DB_REPLICA_PATH or f"{db_path}-replica",
+            interval=Config.DB_REPLICA_INTERVAL,
+            max_lag=Config.DB_REPLICA_MAX_LAG,
+            pages=Config.DB_REPLICA_PAGES,
+            pause=Config.DB_REPLICA_STEP_PAUSE,
+        )
+        _replicas[db_path] = replica
+    return replica
 
 class Database:
     def __init__(self):
         self.db_path = Config.DB_PATH
-    
+        self.pool = get_pool(self.db_path)
+        self.write_queue = get_write_queue(self.db_path)
+        # Реплика для тяжёлых запросов админки и аналитики (DB_REPLICA=1)
+        self.replica = get_replica(self.db_path) if Config.DB_REPLICA else None
+        self._backfill_task: Optional[asyncio.Task] = None
+
+    async def _write(self, sql: str, params: Tuple[Any, ...]):
+        """Запись сразу или через очередь отложенной записи, если она включена"""
+        if self.write_queue.running:
+            await self.write_queue.put(sql, params)
+            return
+        async with self.pool.write() as db:
+            await db.execute(sql, params)
+
+    def _replica_read(self):
+        """Читатель для запросов админки и аналитики: свежая реплика или основная база"""
+        return self.replica.read() if self.replica is not None else self.pool.read()
+
     async def init_db(self):
         """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self.pool.open()
+        await self._migrate()
+        if Config.DB_WRITE_BEHIND:
+            self.write_queue.start()
+
+    async def _migrate(self):
+        """Применение миграций, которых ещё нет в базе. Номер схемы — PRAGMA user_version"""
+        for version, migration in enumerate(self.MIGRATIONS, 1):
+            async with self.pool.write() as db:
+                # IMMEDIATE сразу берёт блокировку записи: воркеры стартуют
+                # одновременно, и миграцию применяет только первый из них
+                await db.execute("BEGIN IMMEDIATE")
+                async with db.execute("PRAGMA user_version") as cursor:
+                    current = (await cursor.fetchone())[0]
+                if current >= version:
+                    continue
+                await migration(self, db)
+                await db.execute(f"PRAGMA user_version = {version}")
+            logger.info(f"Миграция {version} ({migration.__doc__}) применена")
+
+    async def _migration_baseline(self, db: aiosqlite.Connection):
+        """исходная схема"""
+        # IF NOT EXISTS: базы, созданные до миграций, проходят этот шаг без изменений
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                test_result TEXT,
+                test_completed_at TIMESTAMP,
+                answers TEXT
+            )
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                from_chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                status_chat_id INTEGER,
+                status_message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'running',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                PRIMARY KEY (job_id, user_id)
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status
+            ON broadcast_recipients (job_id, status, user_id)
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at
+            ON fsm_storage (updated_at)
+        ''')
+        await self._init_stats(db)
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS quiz_events (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                option TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS quiz_option_counts (
+                question INTEGER NOT NULL,
+                option TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (question, option)
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS quiz_funnel (
+                step INTEGER PRIMARY KEY,
+                reached INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Зеркало подписок на канал: из апдейтов chat_member и проверок через API
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS channel_members (
+                user_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                is_member INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_channel_members_updated_at
+            ON channel_members (updated_at)
+        ''')
+
+    async def _init_stats(self, db: aiosqlite.Connection):
+        """Индексы и счётчики статистики, которые поддерживаются триггерами"""
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_registered_at ON users (registered_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_test_completed_at ON users (test_completed_at)")
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day TEXT PRIMARY KEY,
+                registrations INTEGER NOT NULL DEFAULT 0,
+                completions INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        # Первый запуск на существующей базе: один раз пересчитываем счётчики
+        async with db.execute("SELECT 1 FROM stats_counters WHERE name = 'users_total'") as cursor:
+            initialized = await cursor.fetchone() is not None
+        if not initialized:
             await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    test_result TEXT,
-                    test_completed_at TIMESTAMP,
-                    answers TEXT
-                )
+                INSERT INTO stats_counters (name, value)
+                SELECT 'users_total', COUNT(*) FROM users
+                UNION ALL
+                SELECT 'completed_users', COUNT(test_completed_at) FROM users
+                UNION ALL
+                SELECT 'completions_total', COUNT(test_completed_at) FROM users
             ''')
-            await db.commit()
-    
+            await db.execute('''
+                INSERT INTO stats_daily (day, registrations)
+                SELECT DATE(registered_at), COUNT(*) FROM users
+                WHERE registered_at IS NOT NULL
+                GROUP BY DATE(registered_at)
+            ''')
+            await db.execute('''
+                INSERT INTO stats_daily (day, completions)
+                SELECT DATE(test_completed_at), COUNT(*) FROM users
+                WHERE test_completed_at IS NOT NULL
+                GROUP BY DATE(test_completed_at)
+                ON CONFLICT (day) DO UPDATE SET completions = excluded.completions
+            ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_stats_insert
+            AFTER INSERT ON users
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'users_total';
+                INSERT INTO stats_daily (day, registrations) VALUES (DATE(NEW.registered_at), 1)
+                ON CONFLICT (day) DO UPDATE SET registrations = registrations + 1;
+            END
+        ''')
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_stats_complete
+            AFTER UPDATE OF test_completed_at ON users
+            WHEN NEW.test_completed_at IS NOT NULL
+            BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'completions_total';
+                UPDATE stats_counters SET value = value + 1
+                WHERE name = 'completed_users' AND OLD.test_completed_at IS NULL;
+                INSERT INTO stats_daily (day, completions) VALUES (DATE(NEW.test_completed_at), 1)
+                ON CONFLICT (day) DO UPDATE SET completions = completions + 1;
+            END
+        ''')
+
+    async def _migration_packed_answers(self, db: aiosqlite.Connection):
+        """ответы и результат теста в числовых колонках"""
+        # Старые строки переносит backfill_packed_answers в фоне, пачками
+        await db.execute("ALTER TABLE users ADD COLUMN answers_packed INTEGER")
+        await db.execute("ALTER TABLE users ADD COLUMN result_code INTEGER")
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_result_code
+            ON users (result_code, test_completed_at)
+            WHERE result_code IS NOT NULL
+        ''')
+
+    async def _migration_admin_notifications(self, db: aiosqlite.Connection):
+        """очередь уведомлений админу для нескольких воркеров"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS admin_notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                full_name TEXT NOT NULL,
+                username TEXT NOT NULL,
+                result TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                finished_at TEXT NOT NULL
+            )
+        ''')
+
+    async def _migration_broadcast_owner(self, db: aiosqlite.Connection):
+        """владелец и heartbeat задач рассылки"""
+        await db.execute("ALTER TABLE broadcast_jobs ADD COLUMN owner TEXT")
+        await db.execute("ALTER TABLE broadcast_jobs ADD COLUMN heartbeat_at REAL")
+
+    # Порядок менять нельзя: номер миграции — её позиция в списке
+    MIGRATIONS = (
+        _migration_baseline,
+        _migration_packed_answers,
+        _migration_admin_notifications,
+        _migration_broadcast_owner,
+    )
+
+    def start_backfill(self):
+        """Фоновая конвертация старых строк; запускается один раз на все воркеры"""
+        if self._backfill_task is None or self._backfill_task.done():
+            self._backfill_task = asyncio.create_task(self.backfill_packed_answers())
+
+    def start_replica(self):
+        """Периодические снимки реплики; запускается один раз на все воркеры"""
+        if self.replica is not None:
+            self.replica.start()
+
+    async def backfill_packed_answers(self, batch_size: int = Config.DB_BACKFILL_BATCH,
+                                      pause: float = Config.DB_BACKFILL_PAUSE) -> int:
+        """
+        Перенос ответов из текста «A,B,C» в answers_packed/result_code.
+        Идём по id короткими транзакциями, чтобы не держать блокировку
+        записи и не задерживать запросы пользователей.
+        """
+        converted = 0
+        last_id = 0
+        try:
+            while True:
+                async with self.pool.read() as db:
+                    async with db.execute('''
+                        SELECT id, test_result, answers FROM users
+                        WHERE id > ? AND answers_packed IS NULL
+                          AND (answers IS NOT NULL OR test_result IS NOT NULL)
+                        ORDER BY id
+                        LIMIT ?
+                    ''', (last_id, batch_size)) as cursor:
+                        rows = await cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                await self._backfill_batch([
+                    (encode_answers(_parse_answers_text(answers)), encode_result(result), user_id)
+                    for user_id, result, answers in rows
+                ])
+                converted += len(rows)
+                await asyncio.sleep(pause)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка конвертации ответов (перенесено {converted}): {e}")
+            return converted
+        if converted:
+            logger.info(f"Ответы перенесены в числовые колонки: {converted}")
+        return converted
+
+    @instrumented
+    async def _backfill_batch(self, rows: List[Tuple[int, Optional[int], int]]):
+        # answers_packed IS NULL: строку могли перезаписать, пока пачка
+        # была в памяти, — новый результат не трогаем
+        async with self.pool.write() as db:
+            await db.executemany('''
+                UPDATE users
+                SET answers_packed = ?, result_code = ?, answers = NULL, test_result = NULL
+                WHERE id = ? AND answers_packed IS NULL
+            ''', rows)
+
+    async def close(self):
+        """Сброс очереди записи и закрытие соединений при остановке бота"""
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            await asyncio.gather(self._backfill_task, return_exceptions=True)
+            self._backfill_task = None
+        if self.replica is not None:
+            await self.replica.close()
+        await self.write_queue.stop()
+        await self.pool.close()
+
+    @instrumented
     async def add_user(self, user_id: int, username: str, first_name: str, last_name: str):
         """Добавление нового пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT OR IGNORE INTO users (id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username or "", first_name or "", last_name or ""))
-            await db.commit()
-    
+        await self._write('''
+            INSERT OR IGNORE INTO users (id, username, first_name, last_name)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, username or "", first_name or "", last_name or ""))
+
+    @instrumented
     async def update_test_result(self, user_id: int, result: str, answers: List[str]):
         """Обновление результата теста"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                UPDATE users
-                SET test_result = ?, test_completed_at = CURRENT_TIMESTAMP, answers = ?
-                WHERE id = ?
-            ''', (result, ",".join(answers), user_id))
-            await db.commit()
-    
-    async def get_all_users(self) -> List[int]:
-        """Получение всех пользователей для рассылки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT id FROM users') as cursor:
-                rows = await cursor.fetchall()
-                return [row[0] for row in rows]
-    
-    async def get_new_users_today(self) -> List[Tuple]:
-        """Получение новых пользователей за сегодня"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('''
-                SELECT id, username, first_name, last_name, test_result, test_completed_at, answers
-                FROM users 
-                WHERE DATE(registered_at) = ?
+        await self._write('''
+            UPDATE users
+            SET result_code = ?, test_completed_at = CURRENT_TIMESTAMP, answers_packed = ?,
+                test_result = NULL, answers = NULL
+            WHERE id = ?
+        ''', (encode_result(result), encode_answers(answers), user_id))
+
+    @instrumented
+    async def get_new_users_today(self, limit: int = -1) -> List[Tuple]:
+        """
+        Получение новых пользователей за сегодня (UTC, как и CURRENT_TIMESTAMP):
+        (id, username, first_name, last_name, результат, время прохождения, список ответов)
+        """
+        today = datetime.now(timezone.utc).date()
+        async with self._replica_read() as db:
+            # Диапазон вместо DATE(registered_at) = ?, чтобы работал индекс
+            async with db.execute('''
+                SELECT id, username, first_name, last_name, test_completed_at,
+                       result_code, answers_packed, test_result, answers
+                FROM users
+                WHERE registered_at >= ? AND registered_at < ?
                 ORDER BY registered_at DESC
-            ''', (today,)) as cursor:
-                return await cursor.fetchall()
\ No newline at end of file
+                LIMIT ?
+            ''', (today.isoformat(), (today + timedelta(days=1)).isoformat(), limit)) as cursor:
+                rows = await cursor.fetchall()
+        return [
+            (user_id, username, first_name, last_name,
+             decode_result(result_code, result_text), completed_at,
+             decode_answers(packed, answers_text))
+            for (user_id, username, first_name, last_name, completed_at,
+                 result_code, packed, result_text, answers_text) in rows
+        ]
+
+    @instrumented
+    async def get_export_chunk(self, after_id: int, limit: int, since: Optional[str] = None,
+                               until: Optional[str] = None, result: Optional[str] = None) -> List[Tuple]:
+        """
+        Страница выгрузки по id: после каждой страницы читатель возвращается
+        в пул, и длинная выгрузка не держит одну транзакцию чтения.
+        since/until — границы registered_at (until не включается)
+        """
+        conditions = ["id > ?"]
+        params: List[Any] = [after_id]
+        if since:
+            conditions.append("registered_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("registered_at < ?")
+            params.append(until)
+        if result:
+            # Несконвертированные строки хранят результат текстом
+            conditions.append("(result_code = ? OR (result_code IS NULL AND test_result = ?))")
+            params.extend((encode_result(result), result))
+        params.append(limit)
+        async with self._replica_read() as db:
+            async with db.execute(f'''
+                SELECT id, username, first_name, last_name, registered_at, test_completed_at,
+                       result_code, answers_packed, test_result, answers
+                FROM users
+                WHERE {" AND ".join(conditions)}
+                ORDER BY id
+                LIMIT ?
+            ''', params) as cursor:
+                return [
+                    (user_id, username, first_name, last_name, registered_at, completed_at,
+                     decode_result(result_code, result_text), decode_answers(packed, answers_text))
+                    async for (user_id, username, first_name, last_name, registered_at, completed_at,
+                               result_code, packed, result_text, answers_text) in cursor
+                ]
+
+    @instrumented
+    async def get_scoring_chunk(self, after_id: int, limit: int) -> Tuple[List[int], List[int], List[int]]:
+        """Страница пройденных тестов для пересчёта: id, answers_packed, result_code (0 — нет)"""
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT id, answers_packed, COALESCE(result_code, 0)
+                FROM users
+                WHERE id > ? AND answers_packed IS NOT NULL AND test_completed_at IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (after_id, limit)) as cursor:
+                rows = await cursor.fetchall()
+        if not rows:
+            return [], [], []
+        ids, packed, codes = zip(*rows)
+        return list(ids), list(packed), list(codes)
+
+    @instrumented
+    async def save_result_codes(self, rows: List[Tuple[int, int, int]]):
+        """(result_code, id, answers_packed): строку, где тест успели пройти заново, не трогаем"""
+        async with self.pool.write() as db:
+            await db.executemany('''
+                UPDATE users SET result_code = ?
+                WHERE id = ? AND answers_packed = ?
+            ''', rows)
+
+    @instrumented
+    async def count_unconverted_results(self) -> int:
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT COUNT(*) FROM users
+                WHERE answers_packed IS NULL AND test_completed_at IS NOT NULL
+            ''') as cursor:
+                return (await cursor.fetchone())[0]
+
+    @instrumented
+    async def get_stats(self) -> Dict[str, float]:
+        """Сводная статистика из счётчиков: не зависит от размера таблицы users"""
+        today = datetime.now(timezone.utc).date()
+        async with self._replica_read() as db:
+            async with db.execute("SELECT name, value FROM stats_counters") as cursor:
+                counters = dict(await cursor.fetchall())
+            async with db.execute(
+                "SELECT day, registrations, completions FROM stats_daily WHERE day > ?",
+                ((today - timedelta(days=30)).isoformat(),)
+            ) as cursor:
+                days = await cursor.fetchall()
+
+        def registrations_since(days_back: int) -> int:
+            start = (today - timedelta(days=days_back - 1)).isoformat()
+            return sum(registrations for day, registrations, _ in days if day >= start)
+
+        total = counters.get("users_total", 0)
+        completed = counters.get("completed_users", 0)
+        return {
+            "total": total,
+            "completed": completed,
+            "completion_rate": completed / total * 100 if total else 0.0,
+            "today": registrations_since(1),
+            "week": registrations_since(7),
+            "month": registrations_since(30),
+            "completed_today": sum(completions for day, _, completions in days if day == today.isoformat()),
+        }
+
+    @instrumented
+    async def create_broadcast_job(self, from_chat_id: int, message_id: int,
+                                   status_chat_id: int, status_message_id: int,
+                                   batch_size: int = Config.BROADCAST_RECIPIENTS_BATCH) -> int:
+        """
+        Создание задачи рассылки со списком получателей — всех текущих пользователей.
+        Id читаются страницами из реплики и вставляются короткими транзакциями,
+        чтобы не держать блокировку записи на всю таблицу users. Пока список
+        собирается, задача в статусе preparing, а каждая пачка продлевает её
+        heartbeat_at: по нему видно, что создавший задачу процесс жив.
+        Зарегистрированные после снимка реплики добираются по registered_at
+        """
+        # Любой снимок, который реплика отдаёт, начат не раньше этого момента
+        since = (datetime.now(timezone.utc) - timedelta(seconds=Config.DB_REPLICA_MAX_LAG + 60)).strftime("%Y-%m-%d %H:%M:%S")
+        async with self.pool.write() as db:
+            cursor = await db.execute('''
+                INSERT INTO broadcast_jobs (from_chat_id, message_id, status_chat_id, status_message_id,
+                                            status, heartbeat_at)
+                VALUES (?, ?, ?, ?, 'preparing', ?)
+            ''', (from_chat_id, message_id, status_chat_id, status_message_id, time.time()))
+            job_id = cursor.lastrowid
+        last_id = 0
+        while True:
+            async with self._replica_read() as db:
+                async with db.execute(
+                    "SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ) as cursor:
+                    user_ids = [row[0] for row in await cursor.fetchall()]
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            await self._add_broadcast_recipients(job_id, user_ids)
+        if self.replica is not None:
+            async with self.pool.read() as db:
+                async with db.execute("SELECT id FROM users WHERE registered_at >= ?", (since,)) as cursor:
+                    recent = [row[0] for row in await cursor.fetchall()]
+            for start in range(0, len(recent), batch_size):
+                await self._add_broadcast_recipients(job_id, recent[start:start + batch_size])
+        # Задачу, уже отменённую как зависшую, не оживляем
+        async with self.pool.write() as db:
+            await db.execute(
+                "UPDATE broadcast_jobs SET status = 'running' WHERE id = ? AND status = 'preparing'", (job_id,)
+            )
+        return job_id
+
+    @instrumented
+    async def _add_broadcast_recipients(self, job_id: int, user_ids: List[int]):
+        async with self.pool.write() as db:
+            await db.executemany(
+                "INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id) VALUES (?, ?)",
+                [(job_id, user_id) for user_id in user_ids]
+            )
+            await db.execute("UPDATE broadcast_jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    @instrumented
+    async def get_broadcast_job(self, job_id: Optional[int] = None) -> Optional[Tuple]:
+        """Задача рассылки по id или последняя созданная"""
+        query = '''
+            SELECT id, from_chat_id, message_id, status_chat_id, status_message_id,
+                   status, created_at, finished_at
+            FROM broadcast_jobs
+        '''
+        if job_id is None:
+            query += " ORDER BY id DESC LIMIT 1"
+            params: Tuple = ()
+        else:
+            query += " WHERE id = ?"
+            params = (job_id,)
+        async with self.pool.read() as db:
+            async with db.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+    @instrumented
+    async def get_orphaned_broadcast_jobs(self, stale_before: float) -> List[int]:
+        """Идущие рассылки без владельца или с владельцем, который давно не отмечался"""
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT id FROM broadcast_jobs
+                WHERE status = 'running' AND (owner IS NULL OR heartbeat_at IS NULL OR heartbeat_at < ?)
+                ORDER BY id
+            ''', (stale_before,)) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    @instrumented
+    async def claim_broadcast_job(self, job_id: int, owner: str, stale_before: float) -> bool:
+        """
+        Захват идущей рассылки процессом owner. Удаётся, если владельца нет,
+        это он сам или прежний владелец не отмечался с stale_before.
+        Условие проверяется одним UPDATE — два процесса задачу не захватят
+        """
+        async with self.pool.write() as db:
+            cursor = await db.execute('''
+                UPDATE broadcast_jobs SET owner = ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'running'
+                  AND (owner IS NULL OR owner = ? OR heartbeat_at IS NULL OR heartbeat_at < ?)
+            ''', (owner, time.time(), job_id, owner, stale_before))
+            return cursor.rowcount == 1
+
+    @instrumented
+    async def touch_broadcast_job(self, job_id: int, owner: str) -> bool:
+        """Продление владения; False — задача завершена, отменена или перехвачена"""
+        async with self.pool.write() as db:
+            cursor = await db.execute(
+                "UPDATE broadcast_jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time(), job_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    @instrumented
+    async def release_broadcast_jobs(self, owner: str):
+        """Освобождение рассылок процесса при остановке: их сразу подберёт лидер"""
+        async with self.pool.write() as db:
+            await db.execute(
+                "UPDATE broadcast_jobs SET owner = NULL WHERE owner = ? AND status = 'running'", (owner,)
+            )
+
+    @instrumented
+    async def abandon_stale_broadcast_jobs(self, stale_before: float) -> List[Tuple[int, int, int]]:
+        """
+        Отмена задач, зависших в preparing: создавший их процесс умер, не собрав
+        список получателей. Возвращает [(id, status_chat_id, status_message_id), ...]
+        """
+        async with self.pool.write() as db:
+            async with db.execute('''
+                SELECT id, status_chat_id, status_message_id FROM broadcast_jobs
+                WHERE status = 'preparing' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            ''', (stale_before,)) as cursor:
+                jobs = [tuple(row) for row in await cursor.fetchall()]
+            await db.executemany(
+                "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(job[0],) for job in jobs]
+            )
+        return jobs
+
+    @instrumented
+    async def get_pending_recipients(self, job_id: int, after_user_id: int, limit: int) -> List[int]:
+        """Следующая порция получателей, которым ещё не отправлено"""
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT user_id FROM broadcast_recipients
+                WHERE job_id = ? AND status = 'pending' AND user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+            ''', (job_id, after_user_id, limit)) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    @instrumented
+    async def save_broadcast_results(self, job_id: int, results: List[Tuple[int, str]]):
+        """Сохранение статусов доставки пачкой: [(user_id, status), ...]"""
+        if not results:
+            return
+        async with self.pool.write() as db:
+            await db.executemany(
+                "UPDATE broadcast_recipients SET status = ? WHERE job_id = ? AND user_id = ?",
+                [(status, job_id, user_id) for user_id, status in results]
+            )
+
+    @instrumented
+    async def get_broadcast_counts(self, job_id: int) -> Dict[str, int]:
+        """Количество получателей по статусам"""
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT status, COUNT(*) FROM broadcast_recipients
+                WHERE job_id = ?
+                GROUP BY status
+            ''', (job_id,)) as cursor:
+                return {status: count for status, count in await cursor.fetchall()}
+
+    @instrumented
+    async def finish_broadcast_job(self, job_id: int, status: str):
+        """Отметка задачи рассылки как завершённой или отменённой"""
+        async with self.pool.write() as db:
+            await db.execute('''
+                UPDATE broadcast_jobs
+                SET status = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (status, job_id))
+
+    @instrumented
+    async def get_fsm_record(self, key: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """Состояние и данные FSM (JSON) по ключу"""
+        async with self.pool.read() as db:
+            async with db.execute(
+                "SELECT state, data FROM fsm_storage WHERE key = ?", (key,)
+            ) as cursor:
+                return await cursor.fetchone()
+
+    @instrumented
+    async def save_fsm_records(self, upserts: List[Tuple[str, Optional[str], str, float]], deletes: List[str]):
+        """Запись изменённых FSM-записей одной транзакцией"""
+        async with self.pool.write() as db:
+            if upserts:
+                await db.executemany('''
+                    INSERT INTO fsm_storage (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                ''', upserts)
+            if deletes:
+                await db.executemany("DELETE FROM fsm_storage WHERE key = ?", [(key,) for key in deletes])
+
+    @instrumented
+    async def delete_idle_fsm_records(self, updated_before: float) -> int:
+        """Удаление брошенных FSM-сессий"""
+        async with self.pool.write() as db:
+            cursor = await db.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (updated_before,))
+            return cursor.rowcount
+
+    @instrumented
+    async def save_quiz_events(self, events: List[Tuple], option_deltas: List[Tuple[int, str, int]],
+                               funnel_deltas: List[Tuple[int, int]]):
+        """Пачка событий теста и приращения счётчиков — одной транзакцией"""
+        async with self.pool.write() as db:
+            await db.executemany(
+                "INSERT INTO quiz_events (user_id, event, step, option, created_at) VALUES (?, ?, ?, ?, ?)",
+                events
+            )
+            await db.executemany('''
+                INSERT INTO quiz_option_counts (question, option, count) VALUES (?, ?, ?)
+                ON CONFLICT (question, option) DO UPDATE SET count = count + excluded.count
+            ''', option_deltas)
+            await db.executemany('''
+                INSERT INTO quiz_funnel (step, reached) VALUES (?, ?)
+                ON CONFLICT (step) DO UPDATE SET reached = reached + excluded.reached
+            ''', funnel_deltas)
+
+    @instrumented
+    async def get_quiz_analytics(self) -> Tuple[Dict[int, int], Dict[int, Dict[str, int]]]:
+        """Воронка {шаг: дошло} и распределение {вопрос: {вариант: ответов}}"""
+        async with self._replica_read() as db:
+            async with db.execute("SELECT step, reached FROM quiz_funnel") as cursor:
+                funnel = dict(await cursor.fetchall())
+            options: Dict[int, Dict[str, int]] = {}
+            async with db.execute("SELECT question, option, count FROM quiz_option_counts") as cursor:
+                for question, option, count in await cursor.fetchall():
+                    options.setdefault(question, {})[option] = count
+        return funnel, options
+
+    @instrumented
+    async def save_admin_notification(self, user_id: int, full_name: str, username: str,
+                                      result: str, answers: str, finished_at: str):
+        """Уведомление админу от любого воркера; отправляет их лидер"""
+        await self._write('''
+            INSERT INTO admin_notifications (user_id, full_name, username, result, answers, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, full_name, username, result, answers, finished_at))
+
+    @instrumented
+    async def get_admin_notifications(self, after_id: int, limit: int) -> List[Tuple]:
+        """Уведомления после after_id: (id, user_id, full_name, username, result, answers, finished_at)"""
+        async with self.pool.read() as db:
+            async with db.execute(
+                "SELECT id, user_id, full_name, username, result, answers, finished_at "
+                "FROM admin_notifications WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ) as cursor:
+                return await cursor.fetchall()
+
+    @instrumented
+    async def delete_admin_notifications(self, ids: List[int]):
+        async with self.pool.write() as db:
+            await db.executemany("DELETE FROM admin_notifications WHERE id = ?", [(i,) for i in ids])
+
+    @instrumented
+    async def get_membership(self, user_id: int) -> Optional[Tuple[bool, float]]:
+        """Статус подписки из зеркала: (подписан, когда подтверждён) или None"""
+        async with self.pool.read() as db:
+            async with db.execute(
+                "SELECT is_member, updated_at FROM channel_members WHERE user_id = ?", (user_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return (bool(row[0]), row[1]) if row else None
+
+    @instrumented
+    async def save_memberships(self, rows: List[Tuple[int, str, bool, float]]):
+        """
+        Upsert (user_id, status, is_member, updated_at).
+        Более старое событие не перезаписывает более новое (повторная доставка, гонки).
+        """
+        async with self.pool.write() as db:
+            await db.executemany('''
+                INSERT INTO channel_members (user_id, status, is_member, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    status = excluded.status,
+                    is_member = excluded.is_member,
+                    updated_at = excluded.updated_at
+                WHERE excluded.updated_at >= channel_members.updated_at
+            ''', [(user_id, status, int(is_member), updated_at) for user_id, status, is_member, updated_at in rows])
+
+    @instrumented
+    async def get_stale_memberships(self, updated_before: float, limit: int) -> List[int]:
+        """Пользователи, чей статус давно не подтверждался — самые старые первыми"""
+        async with self.pool.read() as db:
+            async with db.execute('''
+                SELECT user_id FROM channel_members
+                WHERE updated_at < ?
+                ORDER BY updated_at
+                LIMIT ?
+            ''', (updated_before, limit)) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
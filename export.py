@@ -0,0 +1,154 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncGenerator, List, NamedTuple, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from config import Config
+from database import Database
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_RESULTS = ("A", "B", "C")
+EXPORT_FIELDS = (
+    "id", "username", "first_name", "last_name",
+    "registered_at", "test_completed_at", "result", "answers",
+)
+# Лимит Bot API на отправку документа ботом
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+class ExportOptions(NamedTuple):
+    format: str = "csv"
+    since: Optional[date] = None
+    until: Optional[date] = None
+    result: Optional[str] = None
+
+class ExportResult(NamedTuple):
+    file: "tempfile.SpooledTemporaryFile"
+    filename: str
+    rows: int
+    size: int
+
+def parse_export_args(args: Optional[str]) -> ExportOptions:
+    """
+    Аргументы /export в любом порядке: формат (csv/jsonl), результат (A/B/C)
+    и до двух дат ГГГГ-ММ-ДД — начало и конец периода регистрации включительно.
+    При ошибке — ValueError
+    """
+    export_format = "csv"
+    result = None
+    dates: List[date] = []
+    for token in (args or "").split():
+        if token.lower() in EXPORT_FORMATS:
+            export_format = token.lower()
+        elif token.upper() in EXPORT_RESULTS:
+            result = token.upper()
+        else:
+            dates.append(date.fromisoformat(token))
+    if len(dates) > 2:
+        raise ValueError("too many dates")
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    if since and until and since > until:
+        since, until = until, since
+    return ExportOptions(export_format, since, until, result)
+
+class SpooledInputFile(InputFile):
+    """Документ из временного файла: отдаётся частями, чтение с диска — в потоке"""
+
+    def __init__(self, file, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        # С начала: при повторе запроса файл читается заново
+        await asyncio.to_thread(self.file.seek, 0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+class _ExportWriter:
+    """Кодирование строк сразу в gzip поверх временного файла"""
+
+    def __init__(self, file, export_format: str):
+        self.export_format = export_format
+        self._gzip = gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6)
+        # utf-8-sig для CSV: Excel иначе не узнаёт кириллицу
+        encoding = "utf-8-sig" if export_format == "csv" else "utf-8"
+        self._text = io.TextIOWrapper(self._gzip, encoding=encoding, newline="")
+        self._csv = csv.writer(self._text) if export_format == "csv" else None
+        if self._csv:
+            self._csv.writerow(EXPORT_FIELDS)
+
+    def write(self, rows: List[Tuple]):
+        if self._csv:
+            self._csv.writerows(row[:-1] + ("".join(row[-1]),) for row in rows)
+            return
+        for row in rows:
+            self._text.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False))
+            self._text.write("\n")
+
+    def close(self):
+        # Закрывает gzip (дописывает хвост), но не сам временный файл
+        self._text.close()
+
+class UserExporter:
+    """
+    Выгрузка пользователей с результатами теста.
+    Строки читаются страницами по chunk_size и сразу сжимаются во временный
+    файл, который уходит на диск после spool_size байт, — память не растёт
+    с числом пользователей. Сжатие и запись идут в потоке, не в цикле событий.
+    """
+
+    def __init__(self, chunk_size: int = 1000, spool_size: int = 1024 * 1024):
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self._lock = asyncio.Lock()
+        self.db = Database()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def export(self, options: ExportOptions) -> ExportResult:
+        """Файл результата закрывает вызывающий"""
+        async with self._lock:
+            file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            try:
+                rows = await self._write(file, options)
+                size = await asyncio.to_thread(file.seek, 0, io.SEEK_END)
+            except BaseException:
+                file.close()
+                raise
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M")
+        return ExportResult(file, f"users_{stamp}.{options.format}.gz", rows, size)
+
+    async def _write(self, file, options: ExportOptions) -> int:
+        since = options.since.isoformat() if options.since else None
+        # Конец периода включительно: registered_at < следующий день
+        until = (options.until + timedelta(days=1)).isoformat() if options.until else None
+        writer = _ExportWriter(file, options.format)
+        total = 0
+        last_id = 0
+        try:
+            while True:
+                chunk = await self.db.get_export_chunk(
+                    last_id, self.chunk_size, since=since, until=until, result=options.result
+                )
+                if not chunk:
+                    break
+                await asyncio.to_thread(writer.write, chunk)
+                total += len(chunk)
+                last_id = chunk[-1][0]
+        finally:
+            await asyncio.to_thread(writer.close)
+        return total
+
+user_exporter = UserExporter(
+    chunk_size=Config.EXPORT_CHUNK_SIZE,
+    spool_size=Config.EXPORT_SPOOL_SIZE,
+)
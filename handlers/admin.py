@@ -1,16 +1,59 @@
+from typing import Optional
+
 from aiogram import Router, F, Bot
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-import asyncio
 
 from states import TestStates
 from database import Database
+from broadcast import broadcast_manager
 from texts.admin import (
     ADMIN_BROADCAST_START, 
-    ADMIN_BROADCAST_COMPLETE,
-    ADMIN_STATS
+    ADMIN_BROADCAST_PROGRESS,
+    ADMIN_BROADCAST_STATUS,
+    ADMIN_BROADCAST_STATUS_LABELS,
+    ADMIN_BROADCAST_NOT_FOUND,
+    ADMIN_BROADCAST_CANCELLED,
+    ADMIN_BROADCAST_NOT_RUNNING,
+    ADMIN_STATS,
+    ADMIN_DIAG,
+    ADMIN_DIAG_WRITE_QUEUE,
+    ADMIN_DIAG_REPLICA,
+    ADMIN_DIAG_SUBSCRIPTION_CACHE,
+    ADMIN_DIAG_RENDER,
+    ADMIN_DIAG_NOTIFIER,
+    ADMIN_DIAG_SCHEDULER,
+    ADMIN_DIAG_DEDUP,
+    ADMIN_DIAG_THROTTLING,
+    ADMIN_FUNNEL,
+    ADMIN_FUNNEL_STEP,
+    ADMIN_FUNNEL_OPTIONS,
+    ADMIN_FUNNEL_OPTIONS_ROW,
+    ADMIN_FUNNEL_EMPTY,
+    ADMIN_EXPORT_USAGE,
+    ADMIN_EXPORT_STARTED,
+    ADMIN_EXPORT_BUSY,
+    ADMIN_EXPORT_EMPTY,
+    ADMIN_EXPORT_DONE,
+    ADMIN_EXPORT_TOO_LARGE,
+    ADMIN_RESCORE_DRY_RUN,
+    ADMIN_RESCORE_APPLIED,
+    ADMIN_RESCORE_REPORT,
+    ADMIN_RESCORE_TRANSITION,
+    ADMIN_RESCORE_SKIPPED,
+    ADMIN_RESCORE_HINT,
+    ADMIN_RESCORE_BUSY
 )
+from quiz import DEFAULT_QUIZ, QUIZZES
+from utils import subscription_cache
+from render import rendered_messages
+from notifications import admin_notifier
+from scoring import rescore_lock, rescore_users, scoring_model
+from export import MAX_DOCUMENT_SIZE, SpooledInputFile, parse_export_args, user_exporter
+from scheduler import UpdateScheduler
+from middlewares.dedup import DeduplicationMiddleware
+from middlewares.throttling import ThrottlingMiddleware
 from config import Config
 
 router = Router()
@@ -40,28 +83,73 @@ async def process_broadcast(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
     
-    users = await db.get_all_users()
-    total = len(users)
-    success = 0
-    failed = 0
+    await state.clear()
+    status_message = await message.answer(
+        ADMIN_BROADCAST_PROGRESS.format(done=0, total="…", success=0, blocked=0, failed=0, elapsed=0)
+    )
     
-    for user_id in users:
-        try:
-            await message.send_copy(chat_id=user_id)
-            success += 1
-        except Exception as e:
-            failed += 1
-            print(f"Не удалось отправить {user_id}: {e}")
-        await asyncio.sleep(0.05)
+    # Рассылка сохраняется в БД и идёт в фоне, не блокируя обработчик
+    job_id = await db.create_broadcast_job(
+        from_chat_id=message.chat.id,
+        message_id=message.message_id,
+        status_chat_id=status_message.chat.id,
+        status_message_id=status_message.message_id
+    )
+    broadcast_manager.start(bot, job_id)
+
+def parse_job_id(command: CommandObject):
+    if command.args and command.args.strip().isdigit():
+        return int(command.args.strip())
+    return None
+
+@router.message(Command("broadcast_status"))
+async def cmd_broadcast_status(message: Message, command: CommandObject):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    job = await db.get_broadcast_job(parse_job_id(command))
+    if job is None:
+        await message.answer(ADMIN_BROADCAST_NOT_FOUND)
+        return
+    
+    job_id, status, created_at = job[0], job[5], job[6]
+    counts = await db.get_broadcast_counts(job_id)
+    # Для идущей рассылки берём живые счётчики: в БД они сохраняются пачками
+    live = broadcast_manager.live_stats(job_id)
+    success = live.success if live else counts.get("success", 0)
+    blocked = live.blocked if live else counts.get("blocked", 0)
+    failed = live.failed if live else counts.get("failed", 0)
+    total = sum(counts.values())
     
     await message.answer(
-        ADMIN_BROADCAST_COMPLETE.format(
+        ADMIN_BROADCAST_STATUS.format(
+            job_id=job_id,
+            status=ADMIN_BROADCAST_STATUS_LABELS.get(status, status),
+            created_at=created_at,
             total=total,
+            pending=total - success - blocked - failed,
             success=success,
+            blocked=blocked,
             failed=failed
         )
     )
-    await state.clear()
+
+@router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message, command: CommandObject):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    job = await db.get_broadcast_job(parse_job_id(command))
+    if job is None:
+        await message.answer(ADMIN_BROADCAST_NOT_FOUND)
+        return
+    
+    if await broadcast_manager.cancel(job[0]):
+        await message.answer(ADMIN_BROADCAST_CANCELLED.format(job_id=job[0]))
+    else:
+        await message.answer(ADMIN_BROADCAST_NOT_RUNNING.format(job_id=job[0]))
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
@@ -69,16 +157,13 @@ async def cmd_stats(message: Message):
         await message.answer("❌ У вас нет прав для использования этой команды")
         return
     
-    users = await db.get_all_users()
-    today_users = await db.get_new_users_today()
+    stats = await db.get_stats()
+    today_users = await db.get_new_users_today(limit=5)
     
-    stats_text = ADMIN_STATS.format(
-        total=len(users),
-        today=len(today_users)
-    )
+    stats_text = ADMIN_STATS.format(**stats)
     
     if today_users:
-        for user in today_users[:5]:
+        for user in today_users:
             name = f"{user[2]} {user[3] or ''}".strip() or "Без имени"
             username = f"@{user[1]}" if user[1] else "—"
             result = user[4] or "не завершил(а) тест"
@@ -86,4 +171,133 @@ async def cmd_stats(message: Message):
     else:
         stats_text += "\nСегодня новых пользователей нет"
     
-    await message.answer(stats_text)
\ No newline at end of file
+    await message.answer(stats_text)
+
+@router.message(Command("funnel"))
+async def cmd_funnel(message: Message):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    funnel, options = await db.get_quiz_analytics()
+    started = funnel.get(0, 0)
+    if not started:
+        await message.answer(ADMIN_FUNNEL_EMPTY)
+        return
+    
+    questions = len(QUIZZES[DEFAULT_QUIZ])
+    funnel_text = ADMIN_FUNNEL.format(started=started)
+    previous = started
+    for number in range(1, questions + 1):
+        reached = funnel.get(number, 0)
+        funnel_text += ADMIN_FUNNEL_STEP.format(
+            number=number,
+            reached=reached,
+            percent=reached / started * 100,
+            dropped=max(previous - reached, 0)
+        )
+        previous = reached
+    
+    funnel_text += ADMIN_FUNNEL_OPTIONS
+    for number in range(1, questions + 1):
+        counts = options.get(number, {})
+        total = sum(counts.values()) or 1
+        funnel_text += ADMIN_FUNNEL_OPTIONS_ROW.format(
+            number=number,
+            options=" · ".join(
+                f"{option}: {counts.get(option, 0)} ({counts.get(option, 0) / total * 100:.0f}%)"
+                for option in ("A", "B", "C")
+            )
+        )
+    
+    await message.answer(funnel_text)
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    try:
+        options = parse_export_args(command.args)
+    except ValueError:
+        await message.answer(ADMIN_EXPORT_USAGE)
+        return
+    if user_exporter.busy:
+        await message.answer(ADMIN_EXPORT_BUSY)
+        return
+    
+    status_message = await message.answer(ADMIN_EXPORT_STARTED)
+    export = await user_exporter.export(options)
+    try:
+        if not export.rows:
+            await status_message.edit_text(ADMIN_EXPORT_EMPTY)
+        elif export.size > MAX_DOCUMENT_SIZE:
+            await status_message.edit_text(ADMIN_EXPORT_TOO_LARGE.format(size_mb=export.size / 1024 / 1024))
+        else:
+            await message.answer_document(
+                SpooledInputFile(export.file, export.filename),
+                caption=ADMIN_EXPORT_DONE.format(rows=export.rows, size_kb=export.size / 1024)
+            )
+            await status_message.delete()
+    finally:
+        export.file.close()
+
+@router.message(Command("rescore"))
+async def cmd_rescore(message: Message, command: CommandObject):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    # Без аргумента — только отчёт, что изменится; запись — /rescore apply
+    dry_run = (command.args or "").strip().lower() != "apply"
+    if rescore_lock.locked():
+        await message.answer(ADMIN_RESCORE_BUSY)
+        return
+    
+    async with rescore_lock:
+        report = await rescore_users(scoring_model, dry_run=dry_run)
+    
+    text = ADMIN_RESCORE_DRY_RUN if dry_run else ADMIN_RESCORE_APPLIED
+    text += ADMIN_RESCORE_REPORT.format(scored=report.scored, changed=report.changed)
+    for (old, new), count in sorted(report.transitions.items(), key=lambda item: -item[1]):
+        text += ADMIN_RESCORE_TRANSITION.format(old=old or "—", new=new, count=count)
+    if report.skipped:
+        text += ADMIN_RESCORE_SKIPPED.format(skipped=report.skipped)
+    if dry_run and report.changed:
+        text += ADMIN_RESCORE_HINT
+    
+    await message.answer(text)
+
+@router.message(Command("diag"))
+async def cmd_diag(
+    message: Message,
+    update_scheduler: Optional[UpdateScheduler] = None,
+    dedup: Optional[DeduplicationMiddleware] = None,
+    throttling: Optional[ThrottlingMiddleware] = None
+):
+    if message.from_user.id != Config.ADMIN_ID:
+        await message.answer("❌ У вас нет прав для использования этой команды")
+        return
+    
+    write_stats = db.write_queue.stats()
+    diag_text = ADMIN_DIAG
+    diag_text += ADMIN_DIAG_WRITE_QUEUE.format(
+        mode="включена" if db.write_queue.running else "выключена",
+        **write_stats
+    )
+    if db.replica is not None:
+        replica_stats = db.replica.stats()
+        replica_stats["age"] = "нет снимка" if replica_stats["age"] < 0 else f"{replica_stats['age']:.0f} с"
+        diag_text += ADMIN_DIAG_REPLICA.format(**replica_stats)
+    diag_text += ADMIN_DIAG_SUBSCRIPTION_CACHE.format(**subscription_cache.stats())
+    diag_text += ADMIN_DIAG_RENDER.format(**rendered_messages.stats())
+    diag_text += ADMIN_DIAG_NOTIFIER.format(**admin_notifier.stats())
+    if update_scheduler is not None:
+        diag_text += ADMIN_DIAG_SCHEDULER.format(**update_scheduler.stats())
+    if dedup is not None:
+        diag_text += ADMIN_DIAG_DEDUP.format(**dedup.stats())
+    if throttling is not None:
+        diag_text += ADMIN_DIAG_THROTTLING.format(**throttling.stats())
+    
+    await message.answer(diag_text)
@@ -0,0 +1,31 @@
+from aiogram import Router
+from aiogram.types import ChatMemberUpdated
+
+from database import Database
+from utils import is_member_status, subscription_cache
+from config import Config
+
+router = Router()
+db = Database()
+
+def is_our_channel(event: ChatMemberUpdated) -> bool:
+    """CHANNEL_ID может быть числовым id или @username"""
+    channel = str(Config.CHANNEL_ID)
+    if channel.startswith("@"):
+        return (event.chat.username or "").lower() == channel[1:].lower()
+    return str(event.chat.id) == channel
+
+@router.chat_member(is_our_channel)
+async def channel_member_changed(event: ChatMemberUpdated):
+    """Вступление и выход из канала — в зеркало подписок и кэш проверки"""
+    member = event.new_chat_member
+    is_member = is_member_status(member)
+    # Время события, а не обработки: повторно доставленный старый апдейт
+    # не перезапишет более новый статус. event.date точна до секунды, поэтому
+    # считаем, что изменение случилось не позже конца этой секунды: проверка
+    # через API в ту же секунду могла застать статус до него и не должна победить
+    changed_at = event.date.timestamp() + 1
+    await db.save_memberships([(member.user.id, member.status, is_member, changed_at)])
+    # В кэш — то, что осталось в зеркале: устаревший апдейт там ничего не изменил
+    mirrored = await db.get_membership(member.user.id)
+    subscription_cache.set(member.user.id, mirrored[0] if mirrored is not None else is_member)
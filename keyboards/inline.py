@@ -1,8 +1,13 @@
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from texts.questions import OPTIONS
+from quiz import QUIZZES
 from config import Config
 
+# Клавиатуры статичны: каждая собирается один раз, дальше отдаётся тот же объект.
+# Разметка aiogram неизменяема (frozen), поэтому её безопасно переиспользовать.
+
+@lru_cache(maxsize=None)
 def welcome_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="✨ Начать диагностику", callback_data="start_test")
@@ -10,12 +15,14 @@ def welcome_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(1)
     return builder.as_markup()
 
+@lru_cache(maxsize=None)
 def about_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="✨ Начать диагностику", callback_data="start_test")
     builder.adjust(1)
     return builder.as_markup()
 
+@lru_cache(maxsize=None)
 def subscribe_required_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="💬 Перейти в канал", url=Config.CHANNEL_INVITE_LINK or f"https://t.me/{Config.CHANNEL_ID.lstrip('@')}")
@@ -23,25 +30,29 @@ def subscribe_required_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(1)
     return builder.as_markup()
 
+@lru_cache(maxsize=None)
 def subscribe_confirmed_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="✨ Начать диагностику", callback_data="start_test")
     builder.adjust(1)
     return builder.as_markup()
 
-def question_keyboard(q_index: int) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=None)
+def question_keyboard(quiz_id: str, q_index: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
-    for text, callback_data in OPTIONS[q_index]:
-        builder.button(text=text, callback_data=f"ans_{callback_data}")
+    # Номер вопроса в callback_data: нажатие по устаревшей клавиатуре не засчитается
+    for text, callback_data in QUIZZES[quiz_id].options[q_index]:
+        builder.button(text=text, callback_data=f"ans_{q_index}_{callback_data}")
     
-    # Кнопка "Назад" для вопросов 2-8
+    # Кнопка "Назад" для всех вопросов, кроме первого
     if q_index > 0:
-        builder.button(text="🔙 Вернуться к предыдущему вопросу", callback_data="prev_question")
+        builder.button(text="🔙 Вернуться к предыдущему вопросу", callback_data=f"prev_{q_index}")
     
     builder.adjust(1)
     return builder.as_markup()
 
+@lru_cache(maxsize=None)
 def result_keyboard(psychologist_username: str) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -53,4 +64,15 @@ def result_keyboard(psychologist_username: str) -> InlineKeyboardMarkup:
         callback_data="start_test"
     )
     builder.adjust(1)
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+def warm_up_keyboards():
+    """Сборка всех клавиатур при старте, чтобы первый клик не платил за InlineKeyboardBuilder"""
+    welcome_keyboard()
+    about_keyboard()
+    subscribe_required_keyboard()
+    subscribe_confirmed_keyboard()
+    for quiz in QUIZZES.values():
+        for q_index in range(len(quiz)):
+            question_keyboard(quiz.id, q_index)
+    result_keyboard(Config.PSYCHOLOGIST_USERNAME)
@@ -0,0 +1,181 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+# Контекст апдейта: выставляет LogContextMiddleware, читает ContextFilter
+current_update_id: ContextVar[Optional[int]] = ContextVar("current_update_id", default=None)
+current_user_id: ContextVar[Optional[int]] = ContextVar("current_user_id", default=None)
+current_handler: ContextVar[Optional[str]] = ContextVar("current_handler", default=None)
+
+# Поля, которые есть у любой LogRecord, — всё остальное считается extra
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class ContextFilter(logging.Filter):
+    """Дописывает в запись update_id, user_id и обработчик текущего апдейта"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "update_id", None) is None:
+            record.update_id = current_update_id.get()
+        if getattr(record, "user_id", None) is None:
+            record.user_id = current_user_id.get()
+        if getattr(record, "handler", None) is None:
+            record.handler = current_handler.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание повторяющихся предупреждений и ошибок. Одинаковыми считаются
+    записи из одной строки кода с одним типом исключения: при массовой
+    рассылке это тысячи «Не удалось отправить …» с разными chat_id.
+    За window секунд проходят первые burst записей, остальные только
+    считаются; первая запись следующего окна несёт поле suppressed.
+    """
+
+    def __init__(self, window: float = 60.0, burst: int = 5, max_keys: int = 10000):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.max_keys = max_keys
+        # ключ -> [начало окна, записей в окне, отброшено]
+        self._windows: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        error_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.pathname, record.lineno, error_type)
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            self.suppressed_total += 1
+            return False
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; пустые поля контекста не пишутся"""
+
+    def __init__(self, worker_id: Optional[int] = None):
+        super().__init__()
+        self.worker_id = worker_id
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if self.worker_id is not None:
+            entry["worker"] = self.worker_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат (LOG_FORMAT=text) с traceback и счётчиком скрытых повторов"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            text += f" (скрыто похожих записей: {suppressed})"
+        exc = getattr(record, "exc", None)
+        if exc:
+            text += "\n" + exc
+        return text
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Запись в очередь без ожидания: цикл событий не пишет в stderr сам.
+    При переполнении запись теряется и считается в dropped
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и traceback — строками: объекты исключений в очереди не нужны
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc = self._exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[logging.handlers.QueueListener] = None
+queue_handler: Optional[NonBlockingQueueHandler] = None
+sampling_filter: Optional[SamplingFilter] = None
+
+def setup_logging(worker_id: Optional[int] = None):
+    """
+    Корневой логгер пишет в ограниченную очередь, в stderr пишет фоновый поток.
+    Вызывается заново в каждом воркере после fork: поток мастера туда не переходит
+    """
+    global _listener, queue_handler, sampling_filter
+    log_queue: queue.Queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter(worker_id) if Config.LOG_FORMAT == "json" else TextFormatter())
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    sampling_filter = SamplingFilter(window=Config.LOG_SAMPLE_WINDOW, burst=Config.LOG_SAMPLE_BURST)
+    queue_handler.addFilter(sampling_filter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(Config.LOG_LEVEL)
+
+    # Поток мастера после fork не существует — просто создаём новый
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Дописать очередь до конца перед выходом"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
@@ -1,103 +1,442 @@
+import time
+
+# Отсчёт времени запуска — до тяжёлых импортов (aiogram грузится ~3 с)
+PROCESS_STARTED = time.perf_counter()
+
 import asyncio
+import hmac
+import json
 import logging
+import math
 import os
-from aiogram import Bot, Dispatcher, types
+import signal
+import tempfile
+from contextlib import contextmanager
+from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 from config import Config
+import logs
+from logs import setup_logging, stop_logging
 from database import Database
+from broadcast import broadcast_manager
+from analytics import analytics
+from notifications import admin_notifier
+from membership import membership_reconciler
+from storage import SQLiteStorage
+from scheduler import ScheduledRequestHandler
+from middlewares.log_context import LogContextMiddleware
+from middlewares.dedup import DeduplicationMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, BotAPIMetricsMiddleware
+from metrics import metrics
+from profiling import loop_profiler
+from workers import WorkerRegistry, acquire_leader_lock
+import render
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Настройка логирования: очередь и фоновый поток записи (logs.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Импортируем роутеры
-from handlers import user, admin
+from handlers import user, admin, channel
+
+class StartupTimer:
+    """Длительность фаз запуска воркера — в лог и в ответ /ready"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = {}
+
+    def begin(self, name: str):
+        self.phases[name] = -time.perf_counter()
+
+    def end(self, name: str):
+        self.phases[name] = round((time.perf_counter() + self.phases[name]) * 1000, 1)
+
+    @contextmanager
+    def phase(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
 
-async def on_startup(bot: Bot):
-    """Вызывается при запуске: устанавливаем webhook"""
+    def mark(self, name: str):
+        """Фаза от начала запуска до этого момента (например, импорты)"""
+        self.phases[name] = round((time.perf_counter() - self.started) * 1000, 1)
+
+    @property
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def report(self) -> str:
+        return ", ".join(f"{name} {ms:.0f} мс" for name, ms in self.phases.items())
+
+startup_timer = StartupTimer(PROCESS_STARTED)
+
+async def on_startup(bot: Bot, is_leader: bool):
+    """Вызывается при запуске: устанавливаем webhook (только лидер среди воркеров)"""
+    if not is_leader:
+        logger.info("Webhook регистрирует другой воркер")
+        return
+    
     # URL твоего сервиса на Render
     base_url = os.getenv("BASE_URL", "https://твой-сервис.onrender.com")
     webhook_path = f"/webhook/{bot.token}"
     webhook_url = f"{base_url}{webhook_path}"
+    allowed_updates = dp.resolve_used_update_types()
     
-    # Удаляем старый webhook (на всякий случай)
-    await bot.delete_webhook(drop_pending_updates=False)  # ⚠️ Не удаляем pending!
-    
-    # Устанавливаем новый
-    await bot.set_webhook(
-        webhook_url,
-        allowed_updates=dp.resolve_used_update_types(),
-        request_timeout=30,
-    )
+    # Webhook переживает перезапуски: если он уже такой, как нужно, не трогаем.
+    # set_webhook заменяет старый атомарно, delete_webhook перед ним не нужен
+    with startup_timer.phase("webhook"):
+        info = await bot.get_webhook_info()
+        if info.url == webhook_url and set(info.allowed_updates or []) == set(allowed_updates):
+            logger.info(f"✅ Webhook уже установлен: {webhook_url}")
+            return
+        await bot.set_webhook(
+            webhook_url,
+            allowed_updates=allowed_updates,
+            request_timeout=30,
+        )
     logger.info(f"✅ Webhook установлен: {webhook_url}")
 
-async def main():
-    config = Config()
-    
-    bot = Bot(
-        token=config.BOT_TOKEN,
+def get_state_dir() -> str:
+    port = int(os.getenv("PORT", 10000))
+    return Config.WORKERS_STATE_DIR or os.path.join(tempfile.gettempdir(), f"psycho_bot-{port}")
+
+def create_bot() -> Bot:
+    # TELEGRAM_API_URL — свой Bot API сервер (например, локальный для нагрузочных тестов)
+    if Config.TELEGRAM_API_URL:
+        from aiogram.client.telegram import TelegramAPIServer
+        session = AiohttpSession(api=TelegramAPIServer.from_base(Config.TELEGRAM_API_URL))
+    else:
+        session = AiohttpSession()
+    # Время и ошибки каждого вызова Bot API — в /metrics
+    session.middleware(BotAPIMetricsMiddleware())
+    return Bot(
+        token=Config.BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+
+async def create_app(worker_id: int = 0) -> web.Application:
+    """Сборка aiohttp-приложения с ботом, диспетчером и БД для одного воркера"""
+    startup_timer.mark("imports")
+    bot = create_bot()
+    db = Database()
     
-    global dp  # Делаем dp глобальным для setup_application
-    dp = Dispatcher()
+    async def warm_up_api():
+        # Соединение с Bot API (TCP + TLS) устанавливается заранее, а не на первом апдейте
+        try:
+            await bot.get_me()
+        except Exception as e:
+            logger.warning(f"Bot API недоступен при запуске: {e}")
     
-    # Инициализация БД
-    db = Database()
-    await db.init_db()
+    # Независимые подготовительные шаги — параллельно: схема и пул соединений БД,
+    # клавиатуры и экраны результата (в потоке), соединение с Bot API
+    with startup_timer.phase("warm-up"):
+        await asyncio.gather(
+            db.init_db(),
+            asyncio.to_thread(render.warm_up),
+            warm_up_api(),
+        )
     logger.info("✅ База данных инициализирована")
     
+    # FSM хранится в той же SQLite, чтобы переживать перезапуски.
+    # Кэш чтений у каждого процесса свой, поэтому с несколькими воркерами он выключен
+    storage = SQLiteStorage(db, idle_ttl=Config.FSM_IDLE_TTL, cache_reads=Config.WEB_WORKERS == 1,
+                            max_size=Config.FSM_CACHE_SIZE)
+    # По той же причине выключен пропуск правок без изменений: сообщение мог изменить другой воркер
+    render.rendered_messages.enabled = Config.WEB_WORKERS == 1
+    # Апдейты одного пользователя попадают в разные воркеры: с хранилищем,
+    # которое процессы не делят, ответы в тесте терялись бы
+    if Config.WEB_WORKERS > 1 and not getattr(storage, "shared", False):
+        raise RuntimeError("❌ WEB_WORKERS > 1 требует FSM-хранилища, общего для всех процессов")
+    storage.start()
+    analytics.start()
+    
+    startup_timer.begin("dispatcher")
+    global dp  # Делаем dp глобальным для setup_application
+    # FSM-мидлварь подключаем вручную, чтобы повторы отсекались до чтения состояния
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dedup = DeduplicationMiddleware(
+        window=Config.DEDUP_WINDOW,
+        callback_window=Config.DEDUP_CALLBACK_WINDOW,
+        max_size=Config.DEDUP_MAX_KEYS
+    )
+    throttling = ThrottlingMiddleware(
+        limits={
+            "message": (Config.THROTTLE_MESSAGE_RATE, Config.THROTTLE_MESSAGE_BURST),
+            "answer": (Config.THROTTLE_ANSWER_RATE, Config.THROTTLE_ANSWER_BURST),
+            "subscription": (Config.THROTTLE_SUBSCRIPTION_RATE, Config.THROTTLE_SUBSCRIPTION_BURST),
+            "callback": (Config.THROTTLE_CALLBACK_RATE, Config.THROTTLE_CALLBACK_BURST),
+        },
+        max_size=Config.THROTTLE_MAX_USERS,
+        exempt_user_id=Config.ADMIN_ID
+    )
+    log_context = LogContextMiddleware()
+    dp.update.outer_middleware(log_context)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(dedup)
+    if Config.THROTTLE_ENABLED:
+        dp.update.outer_middleware(throttling)
+        dp["throttling"] = throttling
+    dp.update.outer_middleware(dp.fsm)
+    # Внутренние мидлвари диспетчера действуют и на обработчики вложенных роутеров
+    for event_name, observer in dp.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware(log_context)
+            observer.middleware(HandlerMetricsMiddleware())
+    dp["dedup"] = dedup
+    
     # Подключение роутеров
     dp.include_router(user.router)
     dp.include_router(admin.router)
+    dp.include_router(channel.router)
+    
+    # Лидер регистрирует webhook и продолжает прерванные рассылки
+    state_dir = get_state_dir()
+    os.makedirs(state_dir, exist_ok=True)
+    is_leader = acquire_leader_lock(os.path.join(state_dir, "leader.lock"))
+    registry = WorkerRegistry(state_dir, worker_id, expected=Config.WEB_WORKERS)
+    registry.is_leader = is_leader
+    
+    async def resume_broadcasts(bot: Bot):
+        # Продолжаем рассылки, прерванные перезапуском или падением воркера
+        broadcast_manager.start_recovery(bot)
+    
+    async def start_reconciler(bot: Bot):
+        # Сверка зеркала подписок — одна на все воркеры
+        membership_reconciler.start(bot)
+    
+    async def start_notifier(bot: Bot):
+        # Уведомления админу отправляет один процесс: лимит на чат общий
+        admin_notifier.start(bot)
+    
+    async def start_backfill(bot: Bot):
+        # Перенос старых строк в новые колонки после миграций
+        db.start_backfill()
     
-    # Регистрация хука на запуск
+    async def start_replica(bot: Bot):
+        # Снимки реплики для запросов админки — снимает только лидер
+        db.start_replica()
+    
+    # Регистрация хуков на запуск и остановку.
+    # Несрочная работа лидера начинается после того, как воркер стал готов
     dp.startup.register(on_startup)
+    after_ready = [resume_broadcasts, start_notifier, start_reconciler, start_backfill, start_replica] if is_leader else []
+    dp.shutdown.register(broadcast_manager.shutdown)
+    dp.shutdown.register(analytics.stop)
+    dp.shutdown.register(admin_notifier.stop)
+    dp.shutdown.register(membership_reconciler.stop)
+    dp.shutdown.register(db.close)
     
     # Настройка aiohttp-сервера
     app = web.Application()
+    app["bot"] = bot
+    app["registry"] = registry
     
     # Создаём обработчик запросов от Telegram
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot
-    )
+    if Config.UPDATE_SCHEDULER:
+        webhook_requests_handler = ScheduledRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=Config.UPDATE_WORKERS,
+            max_size=Config.UPDATE_QUEUE_SIZE
+        )
+        app["scheduler"] = webhook_requests_handler.scheduler
+        # Попадает в обработчики как аргумент update_scheduler (для /diag)
+        dp["update_scheduler"] = webhook_requests_handler.scheduler
+    else:
+        webhook_requests_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
     webhook_requests_handler.register(app, path=f"/webhook/{bot.token}")
     
-    # Health check для Render
+    # Health check для Render: сводка по всем воркерам
     async def health_handler(request):
-        return web.Response(text="OK", status=200)
+        health = registry.health()
+        if "scheduler" in app:
+            # Очередь апдейтов воркера, который ответил на запрос
+            health["scheduler"] = app["scheduler"].stats()
+        return web.json_response(health, status=200 if health["alive"] else 503)
+    
+    async def ready_handler(request):
+        # /health — процесс жив, /ready — все воркеры запущены и webhook зарегистрирован
+        health = registry.health()
+        health["startup_ms"] = startup_timer.phases
+        return web.json_response(health, status=200 if health["ready"] >= health["expected"] else 503)
+    
+    # Сводные значения очередей на момент сбора метрик
+    metrics.gauge("db_write_queue_depth", "Строк в очереди отложенной записи", lambda: db.write_queue.depth)
+    metrics.gauge("admin_notifications_pending", "Уведомлений админу в очереди", lambda: admin_notifier.stats()["pending"])
+    metrics.gauge("dedup_dropped_updates_total", "Отброшено повторных доставок апдейтов",
+                  lambda: dedup.dropped_updates, kind="counter")
+    metrics.gauge("dedup_dropped_callbacks_total", "Отброшено двойных нажатий",
+                  lambda: dedup.dropped_callbacks, kind="counter")
+    if db.replica is not None:
+        metrics.gauge("db_replica_reads_total", "Запросов админки, прочитанных из реплики",
+                      lambda: db.replica.replica_reads, kind="counter")
+        metrics.gauge("db_replica_fallbacks_total", "Запросов админки в основную базу: реплики нет или она устарела",
+                      lambda: db.replica.fallbacks, kind="counter")
+    metrics.gauge("log_records_dropped_total", "Записей лога потеряно из-за переполнения очереди",
+                  lambda: logs.queue_handler.dropped, kind="counter")
+    metrics.gauge("log_records_suppressed_total", "Повторяющихся записей лога скрыто",
+                  lambda: logs.sampling_filter.suppressed_total, kind="counter")
+    if Config.THROTTLE_ENABLED:
+        for kind in throttling.limits:
+            metrics.gauge(f"throttled_{kind}_total", f"Отброшено апдейтов сверх лимита частоты ({kind})",
+                          lambda kind=kind: throttling.throttled[kind], kind="counter")
+    if "scheduler" in app:
+        scheduler = app["scheduler"]
+        metrics.gauge("update_queue_depth", "Апдейтов в очереди", lambda: scheduler.depth)
+        metrics.gauge("update_queue_in_flight", "Апдейтов в обработке", lambda: scheduler.in_flight)
+        metrics.gauge("update_queue_rejected_total", "Апдейтов отклонено с 503",
+                      lambda: scheduler.rejected, kind="counter")
+    
+    # С несколькими воркерами каждый пишет снимок метрик рядом с heartbeat,
+    # а /metrics складывает их — сбор не зависит от того, какой воркер ответил
+    metrics_path = os.path.join(state_dir, f"worker-{worker_id}.metrics")
+    if Config.WEB_WORKERS > 1:
+        registry.on_beat.append(lambda: metrics.dump(metrics_path))
+    
+    async def metrics_handler(request):
+        snapshots = [metrics.snapshot()]
+        if Config.WEB_WORKERS > 1:
+            for name in os.listdir(state_dir):
+                path = os.path.join(state_dir, name)
+                if not name.endswith(".metrics") or path == metrics_path:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f)["metrics"])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return web.Response(text=metrics.render(snapshots), content_type="text/plain", charset="utf-8")
+    
+    def profile_authorized(request) -> bool:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ") or request.query.get("token", "")
+        return hmac.compare_digest(token, Config.PROFILE_TOKEN)
+    
+    async def profile_handler(request):
+        # /debug/profile?seconds=10 — collapsed stacks этого воркера за seconds секунд
+        if not profile_authorized(request):
+            return web.Response(status=403)
+        if loop_profiler.running:
+            return web.Response(status=409, text="Profiling is already running")
+        try:
+            seconds = float(request.query.get("seconds", "10"))
+            interval = float(request.query["interval"]) if "interval" in request.query else None
+        except ValueError:
+            return web.Response(status=400, text="seconds and interval must be numbers")
+        if not math.isfinite(seconds) or (interval is not None and not math.isfinite(interval)):
+            return web.Response(status=400, text="seconds and interval must be finite")
+        stacks, samples, slow = await loop_profiler.profile(seconds, interval)
+        return web.Response(
+            text=stacks,
+            content_type="text/plain",
+            charset="utf-8",
+            headers={
+                "Content-Disposition": f'attachment; filename="profile-worker{worker_id}.folded"',
+                "X-Worker-Id": str(worker_id),
+                "X-Samples": str(samples),
+                "X-Slow-Callbacks": str(len(slow)),
+            },
+        )
+    
+    async def slow_callbacks_handler(request):
+        # Медленные шаги цикла событий, найденные во время замеров
+        if not profile_authorized(request):
+            return web.Response(status=403)
+        return web.json_response({"worker": worker_id, "slow_callbacks": list(loop_profiler.slow_callbacks)})
+    
     app.router.add_get("/", health_handler)
     app.router.add_get("/health", health_handler)
+    app.router.add_get("/ready", ready_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    if Config.PROFILE_TOKEN:
+        loop_profiler.register_handlers(dp)
+        app.router.add_get("/debug/profile", profile_handler)
+        app.router.add_get("/debug/slow", slow_callbacks_handler)
     
     # Подключаем aiogram к aiohttp
-    setup_application(app, dp, bot=bot)
+    setup_application(app, dp, bot=bot, is_leader=is_leader)
     
-    # Запуск сервера
-    runner = web.AppRunner(app)
-    await runner.setup()
+    async def start_registry(app: web.Application):
+        registry.start()
     
-    port = int(os.getenv("PORT", 10000))
-    site = web.TCPSite(runner, host="0.0.0.0", port=port)
-    await site.start()
+    async def stop_registry(app: web.Application):
+        await registry.stop()
+    
+    app.on_startup.insert(0, start_registry)
+    app.on_shutdown.append(stop_registry)
+    app["after_ready"] = after_ready
+    startup_timer.end("dispatcher")
+    return app
+
+async def main(worker_id: int = 0):
+    app = await create_app(worker_id)
+    
+    # Запуск сервера (on_startup: регистрация webhook и фоновые задачи)
+    with startup_timer.phase("server"):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        
+        port = int(os.getenv("PORT", 10000))
+        # SO_REUSEPORT: все воркеры слушают один порт, ядро распределяет соединения
+        site = web.TCPSite(runner, host="0.0.0.0", port=port, reuse_port=Config.WEB_WORKERS > 1)
+        await site.start()
+    app["registry"].mark_ready()
+    
+    logger.info(f"🚀 Бот запущен на порту {port} (воркер {worker_id + 1}/{Config.WEB_WORKERS})")
+    logger.info(f"👤 Админ ID: {Config.ADMIN_ID}")
+    logger.info(f"⏱ Готов за {startup_timer.total_ms:.0f} мс: {startup_timer.report()}")
     
-    logger.info(f"🚀 Бот запущен на порту {port}")
-    logger.info(f"👤 Админ ID: {config.ADMIN_ID}")
+    for job in app["after_ready"]:
+        try:
+            await job(app["bot"])
+        except Exception as e:
+            logger.error(f"❌ Ошибка фоновой задачи {job.__name__}: {e}")
     
-    # Держим процесс запущенным
-    await asyncio.Event().wait()
+    # Держим процесс запущенным до SIGTERM/SIGINT (Render шлёт SIGTERM при деплое)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+    finally:
+        # Корректно закрываем сервер, сессию бота и соединения с БД
+        await runner.cleanup()
+
+def run_worker(worker_id: int):
+    """Точка входа дочернего процесса в режиме нескольких воркеров"""
+    # Обработчики сигналов мастера наследуются при fork — сбрасываем
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Импорты сделал мастер до fork — отсчёт запуска воркера начинается здесь
+    startup_timer.started = time.perf_counter()
+    # Поток записи логов мастера после fork не существует
+    setup_logging(worker_id)
+    try:
+        asyncio.run(main(worker_id))
+    finally:
+        # Дочерний процесс завершается через os._exit, atexit не сработает
+        stop_logging()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if Config.WEB_WORKERS > 1:
+            logger.info(f"🧵 Запуск {Config.WEB_WORKERS} воркеров на порту {os.getenv('PORT', 10000)}")
+            # multiprocessing нужен только мастеру нескольких воркеров
+            from workers import serve_workers
+            serve_workers(Config.WEB_WORKERS, run_worker, get_state_dir())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("⏹️ Бот остановлен")
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
-        raise
\ No newline at end of file
+        raise
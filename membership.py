@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import Config
+from database import Database
+from utils import is_member_status, subscription_cache
+
+logger = logging.getLogger(__name__)
+
+class MembershipReconciler:
+    """
+    Фоновая сверка зеркала подписок: записи старше половины MEMBERSHIP_MAX_AGE
+    перепроверяются через get_chat_member небольшими пачками с ограничением
+    скорости, чтобы не мешать основному трафику бота.
+    """
+
+    def __init__(self, db: Database, interval: float, batch_size: int, rate: float, max_age: float):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rate = rate
+        self.max_age = max_age
+        self._task: Optional[asyncio.Task] = None
+        self.checked = 0
+        self.changed = 0
+        self.errors = 0
+
+    def start(self, bot: Bot):
+        # Нулевой интервал или скорость выключают сверку
+        if self._task is None and self.interval > 0 and self.rate > 0:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, bot: Bot):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile(bot)
+            except Exception as e:
+                logger.error(f"Ошибка сверки подписок: {e}")
+
+    async def reconcile(self, bot: Bot) -> int:
+        """Одна пачка сверки; возвращает число проверенных пользователей"""
+        user_ids = await self.db.get_stale_memberships(time.time() - self.max_age / 2, self.batch_size)
+        rows = []
+        for user_id in user_ids:
+            try:
+                member = await bot.get_chat_member(Config.CHANNEL_ID, user_id)
+                status, is_member = member.status, is_member_status(member)
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                break
+            except TelegramBadRequest:
+                # Пользователь удалил аккаунт или никогда не был в канале
+                status, is_member = "left", False
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Ошибка сверки подписки {user_id}: {e}", extra={"user_id": user_id})
+                break
+            cached = await self.db.get_membership(user_id)
+            if cached is not None and cached[0] != is_member:
+                self.changed += 1
+            rows.append((user_id, status, is_member, time.time()))
+            subscription_cache.set(user_id, is_member)
+            self.checked += 1
+            if self.rate > 0:
+                await asyncio.sleep(1 / self.rate)
+        if rows:
+            await self.db.save_memberships(rows)
+        return len(rows)
+
+membership_reconciler = MembershipReconciler(
+    Database(),
+    interval=Config.MEMBERSHIP_RECONCILE_INTERVAL,
+    batch_size=Config.MEMBERSHIP_RECONCILE_BATCH,
+    rate=Config.MEMBERSHIP_RECONCILE_RATE,
+    max_age=Config.MEMBERSHIP_MAX_AGE,
+)
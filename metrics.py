@@ -0,0 +1,204 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя корзина — +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metric:
+    """Семейство метрик с метками; дочерние объекты создаются один раз на набор меток"""
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def snapshot(self) -> List:
+        return [[list(key), child.value] for key, child in self._children.items()]
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def snapshot(self) -> List:
+        return [[list(key), child.counts, child.sum, child.count] for key, child in self._children.items()]
+
+class Gauge(Metric):
+    """
+    Значение, которое вычисляется в момент сбора (глубина очередей и т.п.).
+    kind="counter" — для уже существующих счётчиков, которые только растут.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge"):
+        super().__init__(name, documentation)
+        self.read = read
+        self.type = kind
+
+    def snapshot(self) -> List:
+        try:
+            return [[[], float(self.read())]]
+        except Exception:
+            return []
+
+class MetricsRegistry:
+    """
+    Метрики процесса в формате Prometheus. Запись — это инкремент
+    или bisect по корзинам, поэтому сбор включён всегда.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _add(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge") -> Gauge:
+        """Повторная регистрация заменяет функцию (объекты пересоздаются в create_app)"""
+        metric = self._add(Gauge(name, documentation, read, kind))
+        metric.read = read
+        return metric
+
+    def snapshot(self) -> Dict[str, List]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def dump(self, path: str):
+        """Снимок в файл — из таких файлов /metrics собирает сумму по воркерам"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"time": time.time(), "metrics": self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def render(self, snapshots: Optional[List[Dict[str, List]]] = None) -> str:
+        """Текстовый формат Prometheus; несколько снимков складываются"""
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+        lines = []
+        for name, metric in self._metrics.items():
+            merged: Dict[Tuple[str, ...], list] = {}
+            for snapshot in snapshots:
+                for row in snapshot.get(name, []):
+                    key = tuple(row[0])
+                    if metric.type == "histogram":
+                        total = merged.setdefault(key, [[0] * len(row[1]), 0.0, 0])
+                        total[0] = [a + b for a, b in zip(total[0], row[1])]
+                        total[1] += row[2]
+                        total[2] += row[3]
+                    else:
+                        merged[key] = [merged.get(key, [0.0])[0] + row[1]]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, values in merged.items():
+                if metric.type != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labelnames, key)} {_format_value(values[0])}")
+                    continue
+                counts, total_sum, total_count = values
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{name}_bucket{_format_labels(metric.labelnames, key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(metric.labelnames, key)} {_format_value(total_sum)}")
+                lines.append(f"{name}_count{_format_labels(metric.labelnames, key)} {total_count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+UPDATE_SECONDS = metrics.histogram(
+    "bot_update_seconds", "Полное время обработки апдейта", ["type"])
+HANDLER_SECONDS = metrics.histogram(
+    "bot_handler_seconds", "Время работы обработчика", ["handler"])
+HANDLER_ERRORS = metrics.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler", "error"])
+API_SECONDS = metrics.histogram(
+    "bot_api_request_seconds", "Время запроса к Bot API", ["method"])
+API_ERRORS = metrics.counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+API_RETRY_AFTER = metrics.counter(
+    "bot_api_retry_after_total", "Ответы Bot API с требованием подождать (flood control)", ["method"])
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_seconds", "Время запроса к SQLite", ["query"])
+DB_QUERY_ERRORS = metrics.counter(
+    "db_query_errors_total", "Ошибки запросов к SQLite", ["query"])
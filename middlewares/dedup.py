@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+class RecentKeys:
+    """Ключи за последние window секунд, не больше max_size штук (старые вытесняются)"""
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def _expire(self, now: float):
+        items = self._items
+        while items:
+            key, (_, seen_at) = next(iter(items.items()))
+            if now - seen_at < self.window and len(items) <= self.max_size:
+                break
+            items.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        self._expire(now)
+        item = self._items.get(key)
+        return item[0] if item is not None else None
+
+    def set(self, key: Hashable, value: Any = True):
+        now = time.monotonic()
+        self._items[key] = (value, now)
+        self._items.move_to_end(key)
+        self._expire(now)
+
+    def discard(self, key: Hashable):
+        self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    Отбрасывает повторы до FSM и БД:
+    — update_id, который уже обрабатывался (повторная доставка webhook);
+    — нажатие той же кнопки под тем же сообщением в течение callback_window
+      секунд, если между нажатиями не было других кнопок этого сообщения
+      (двойной клик). Окно короткое: осознанный повтор, например
+      «Проверить подписку» после подписки, проходит.
+    Регистрируется на dp.update раньше FSM-мидлвари.
+    """
+
+    def __init__(self, window: float = 60.0, callback_window: float = 3.0, max_size: int = 100000):
+        self.updates = RecentKeys(window, max_size)
+        # (user_id, chat_id, message_id) -> callback_data последнего нажатия
+        self.callbacks = RecentKeys(callback_window, max_size)
+        self.dropped_updates = 0
+        self.dropped_callbacks = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        if self.updates.get(event.update_id) is not None:
+            self.dropped_updates += 1
+            return None
+        self.updates.set(event.update_id)
+
+        callback = event.callback_query
+        key = None
+        if callback is not None and callback.message is not None and callback.data:
+            key = (callback.from_user.id, callback.message.chat.id, callback.message.message_id)
+            if self.callbacks.get(key) == callback.data:
+                self.dropped_callbacks += 1
+                # Иначе на кнопке останется индикатор загрузки
+                try:
+                    await callback.answer()
+                except Exception as e:
+                    logger.warning(f"Ошибка ответа на двойное нажатие: {e}")
+                return None
+            self.callbacks.set(key, callback.data)
+
+        try:
+            return await handler(event, data)
+        except BaseException:
+            # Апдейт не обработан: повторная доставка или нажатие должны пройти
+            self.updates.discard(event.update_id)
+            if key is not None:
+                self.callbacks.discard(key)
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "tracked_updates": len(self.updates),
+            "tracked_callbacks": len(self.callbacks),
+            "dropped_updates": self.dropped_updates,
+            "dropped_callbacks": self.dropped_callbacks,
+        }
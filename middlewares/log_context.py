@@ -0,0 +1,37 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from logs import current_handler, current_update_id, current_user_id
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Контекст для логов. На dp.update (первым из своих outer) выставляет
+    update_id и user_id, на остальных обсерверах (inner) — имя обработчика.
+    Всё, что залогировано внутри обработки апдейта, получает эти поля
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            user = data.get("event_from_user")
+            update_token = current_update_id.set(event.update_id)
+            user_token = current_user_id.set(user.id if user is not None else None)
+            try:
+                return await handler(event, data)
+            finally:
+                current_update_id.reset(update_token)
+                current_user_id.reset(user_token)
+
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        handler_token = current_handler.set(getattr(callback, "__name__", None))
+        try:
+            return await handler(event, data)
+        finally:
+            current_handler.reset(handler_token)
@@ -0,0 +1,78 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from metrics import (
+    UPDATE_SECONDS,
+    HANDLER_SECONDS,
+    HANDLER_ERRORS,
+    API_SECONDS,
+    API_ERRORS,
+    API_RETRY_AFTER
+)
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешняя мидлварь dp.update: полное время апдейта по типу (message, callback_query...)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+            UPDATE_SECONDS.labels(event_type).observe(time.perf_counter() - started)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренняя мидлварь: имя обработчика известно только после фильтров,
+    поэтому время по обработчикам снимается здесь, а не во внешней мидлвари.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(handler_object.callback, "__name__", "unknown") if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Мидлварь сессии бота: время каждого метода Bot API, ошибки и flood control"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            API_RETRY_AFTER.labels(name).inc()
+            raise
+        except Exception as e:
+            API_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            API_SECONDS.labels(name).observe(time.perf_counter() - started)
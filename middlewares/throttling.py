@@ -0,0 +1,122 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_CALLBACK_TEXT = "⏳ Не так быстро"
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты на пользователя: token bucket на каждый вид апдейта
+    (сообщения, ответы в тесте, проверка подписки, прочие кнопки).
+    limits: вид -> (токенов в секунду, размер корзины); вид со скоростью
+    0 или меньше не ограничивается.
+    Лишнее нажатие получает короткий answerCallbackQuery и дальше FSM
+    не идёт, лишнее сообщение просто отбрасывается.
+    Корзины хранятся в LRU не больше max_size штук; корзина, которая
+    успела наполниться, ничем не отличается от новой и удаляется.
+    Регистрируется на dp.update после DeduplicationMiddleware и до FSM.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_size: int = 100000,
+                 exempt_user_id: Optional[int] = None):
+        self.limits = {kind: (rate, burst) for kind, (rate, burst) in limits.items() if rate > 0}
+        self.max_size = max_size
+        self.exempt_user_id = exempt_user_id
+        # Через сколько секунд простоя корзина снова полная
+        self._refill_time = {kind: burst / rate for kind, (rate, burst) in self.limits.items()}
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+        self.allowed = 0
+        self.throttled: Dict[str, int] = {kind: 0 for kind in limits}
+        self.evicted = 0
+
+    @staticmethod
+    def update_kind(event: Update) -> Optional[Tuple[int, str]]:
+        """(user_id, вид) для ограничиваемых апдейтов, иначе None"""
+        message = event.message or event.edited_message
+        if message is not None and message.from_user is not None:
+            return message.from_user.id, "message"
+        callback = event.callback_query
+        if callback is not None:
+            data = callback.data or ""
+            if data == "check_subscription":
+                kind = "subscription"
+            elif data.startswith(("ans_", "prev_")):
+                kind = "answer"
+            else:
+                kind = "callback"
+            return callback.from_user.id, kind
+        return None
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            (user_id, kind), bucket = next(iter(buckets.items()))
+            if len(buckets) <= self.max_size and now - bucket.updated_at < self._refill_time[kind]:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def allow(self, user_id: int, kind: str) -> bool:
+        limit = self.limits.get(kind)
+        if limit is None:
+            return True
+        rate, burst = limit
+        now = time.monotonic()
+        key = (user_id, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+            self._buckets.move_to_end(key)
+        self._evict(now)
+        if bucket.tokens < 1:
+            self.throttled[kind] += 1
+            return False
+        bucket.tokens -= 1
+        self.allowed += 1
+        return True
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        target = self.update_kind(event)
+        if target is None or target[0] == self.exempt_user_id or self.allow(*target):
+            return await handler(event, data)
+
+        if event.callback_query is not None:
+            # Иначе у пользователя будет крутиться индикатор загрузки на кнопке
+            try:
+                await event.callback_query.answer(THROTTLED_CALLBACK_TEXT)
+            except Exception as e:
+                logger.warning(f"Ошибка ответа на лишнее нажатие: {e}")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._buckets),
+            "allowed": self.allowed,
+            "evicted": self.evicted,
+            "throttled": sum(self.throttled.values()),
+            **{f"throttled_{kind}": count for kind, count in self.throttled.items()},
+        }
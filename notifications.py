@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, NamedTuple, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import Config
+from database import Database
+from texts.admin import (
+    ADMIN_NEW_USER_NOTIFICATION,
+    ADMIN_DIGEST_HEADER,
+    ADMIN_DIGEST_ITEM,
+    ADMIN_DIGEST_DROPPED
+)
+from utils import format_answers_for_admin, format_answers_compact
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API — около одного сообщения в секунду в один чат
+MIN_SEND_GAP = 1.1
+MAX_MESSAGE_LENGTH = 4096
+
+class Completion(NamedTuple):
+    user_id: int
+    full_name: str
+    username: str
+    result: str
+    answers: List[str]
+    finished_at: datetime
+
+class AdminNotifier:
+    """
+    Уведомления админу о пройденных тестах вне обработчика.
+    В затишье каждое уведомление уходит сразу и целиком, при всплеске
+    они копятся в течение окна и отправляются сводкой до max_items человек.
+    С несколькими воркерами (shared_db) у каждого свой процесс, а лимит на чат
+    админа общий: воркеры только пишут уведомления в таблицу admin_notifications,
+    а отправляет их один лидер, забирая таблицу раз в poll_interval секунд.
+    """
+
+    def __init__(self, chat_id: int, window: float = 10.0, max_items: int = 25, max_pending: int = 10000,
+                 shared_db: Optional[Database] = None, poll_interval: float = 1.0):
+        self.chat_id = chat_id
+        self.window = window
+        self.max_items = max_items
+        self.max_pending = max_pending
+        self.shared_db = shared_db
+        self.poll_interval = poll_interval
+        self._pending: Deque[Completion] = deque()
+        # id строк admin_notifications, загруженных в _pending
+        self._loaded_ids: List[int] = []
+        self._last_sent_id = 0
+        self._saving: Set[asyncio.Task] = set()
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._last_sent = 0.0
+        self.sent = 0
+        self.digests = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def notify(self, user, result: str, answers: List[str]):
+        """Постановка уведомления в очередь; обработчик не ждёт отправки"""
+        item = Completion(
+            user_id=user.id,
+            full_name=f"{user.first_name} {user.last_name or ''}".strip(),
+            username=f"@{user.username}" if user.username else "не указан",
+            result=result,
+            answers=list(answers),
+            finished_at=datetime.now(),
+        )
+        if self.shared_db is not None:
+            task = asyncio.create_task(self._save_shared(item))
+            self._saving.add(task)
+            task.add_done_callback(self._saving.discard)
+            return
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(item)
+        self._wakeup.set()
+
+    async def _save_shared(self, item: Completion):
+        try:
+            await self.shared_db.save_admin_notification(
+                item.user_id, item.full_name, item.username, item.result,
+                "".join(item.answers), item.finished_at.isoformat()
+            )
+        except Exception as e:
+            self.dropped += 1
+            logger.error(f"Ошибка сохранения уведомления админу: {e}")
+
+    async def _load_shared(self):
+        """Новые уведомления всех воркеров из SQLite в локальную очередь лидера"""
+        after_id = self._loaded_ids[-1] if self._loaded_ids else self._last_sent_id
+        rows = await self.shared_db.get_admin_notifications(after_id, self.max_pending - len(self._pending))
+        for row_id, user_id, full_name, username, result, answers, finished_at in rows:
+            self._loaded_ids.append(row_id)
+            self._pending.append(Completion(
+                user_id, full_name, username, result, list(answers), datetime.fromisoformat(finished_at)
+            ))
+
+    async def _forget_sent(self):
+        """Удаление из таблицы всего, что уже ушло из локальной очереди"""
+        if self.shared_db is None:
+            return
+        sent_ids = self._loaded_ids[:len(self._loaded_ids) - len(self._pending)]
+        if sent_ids:
+            await self.shared_db.delete_admin_notifications(sent_ids)
+            self._last_sent_id = sent_ids[-1]
+            del self._loaded_ids[:len(sent_ids)]
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._saving:
+            await asyncio.gather(*self._saving, return_exceptions=True)
+        # Отправляем накопленное, чтобы не потерять уведомления при деплое.
+        # У общей очереди неотправленное остаётся в таблице до следующего запуска
+        await self.flush()
+        if self.shared_db is not None:
+            await self._forget_sent()
+
+    async def _wait_pending(self):
+        if self.shared_db is None:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            return
+        while not self._pending:
+            await self._forget_sent()
+            await asyncio.sleep(self.poll_interval)
+            await self._load_shared()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._wait_pending()
+                # После недавней отправки ждём конца окна — за это время соберётся сводка
+                delay = self._last_sent + self.window - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if self.shared_db is not None:
+                        await self._load_shared()
+                await self.flush()
+                await self._forget_sent()
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений админу: {e}")
+
+    async def flush(self):
+        if self._bot is None or not self._pending:
+            return
+        if len(self._pending) == 1 and not self.dropped:
+            await self._send(self._format_single(self._pending.popleft()))
+            return
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.max_items, len(self._pending)))]
+            for text in self._format_digest(batch):
+                await self._send(text)
+                self.digests += 1
+
+    def _format_single(self, item: Completion) -> str:
+        return ADMIN_NEW_USER_NOTIFICATION.format(
+            date=item.finished_at.strftime('%d.%m.%Y %H:%M'),
+            user_id=item.user_id,
+            full_name=item.full_name,
+            username=item.username,
+            result=item.result,
+            answers=format_answers_for_admin(item.answers)
+        )
+
+    def _format_digest(self, batch: List[Completion]) -> List[str]:
+        """Сводка по пачке; если не влезает в одно сообщение — делится на несколько"""
+        entries = [
+            ADMIN_DIGEST_ITEM.format(
+                time=item.finished_at.strftime('%H:%M:%S'),
+                user_id=item.user_id,
+                full_name=item.full_name,
+                username=item.username,
+                result=item.result,
+                answers=format_answers_compact(item.answers)
+            )
+            for item in batch
+        ]
+        footer = ""
+        if self.dropped and not self._pending:
+            footer = ADMIN_DIGEST_DROPPED.format(count=self.dropped)
+            self.dropped = 0
+
+        texts = []
+        chunk: List[str] = []
+        for entry in entries:
+            if chunk and len(self._digest_text(chunk + [entry], batch, footer)) > MAX_MESSAGE_LENGTH:
+                texts.append(self._digest_text(chunk, batch, ""))
+                chunk = []
+            chunk.append(entry)
+        texts.append(self._digest_text(chunk, batch, footer))
+        return texts
+
+    def _digest_text(self, entries: List[str], batch: List[Completion], footer: str) -> str:
+        header = ADMIN_DIGEST_HEADER.format(
+            count=len(batch),
+            start=batch[0].finished_at.strftime('%H:%M:%S'),
+            end=batch[-1].finished_at.strftime('%H:%M:%S')
+        )
+        return header + "\n".join(entries) + footer
+
+    async def _send(self, text: str):
+        # Соблюдаем лимит на один чат и между сообщениями одной сводки
+        gap = self._last_sent + MIN_SEND_GAP - time.monotonic()
+        if gap > 0:
+            await asyncio.sleep(gap)
+        while True:
+            try:
+                await self._bot.send_message(self.chat_id, text, parse_mode="HTML")
+                self.sent += 1
+                break
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка отправки уведомления админу: {e}")
+                break
+        self._last_sent = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "digests": self.digests,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+admin_notifier = AdminNotifier(
+    Config.ADMIN_ID,
+    window=Config.ADMIN_DIGEST_WINDOW,
+    max_items=Config.ADMIN_DIGEST_MAX_ITEMS,
+    shared_db=Database() if Config.WEB_WORKERS > 1 else None
+)
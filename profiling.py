@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import CodeType, FrameType
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Ограничение на один запуск, чтобы профилирование нельзя было забыть включённым
+MAX_PROFILE_SECONDS = 120
+# Чаще снимать стек бессмысленно: поток семплера займёт GIL и затормозит сам цикл
+MIN_PROFILE_INTERVAL = 0.001
+
+class StackSampler(threading.Thread):
+    """
+    Семплирующий профилировщик: поток раз в interval секунд снимает стек
+    потока цикла событий и копит их в формате collapsed stacks
+    («a;b;c 12» — вход flamegraph.pl, speedscope, inferno).
+    """
+
+    def __init__(self, thread_id: int, interval: float, handler_names: Dict[CodeType, str]):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.handler_names = handler_names
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # (время снимка, обработчик на стеке) — чтобы назвать, кто держал цикл
+        self.recent: Deque[Tuple[float, Optional[str]]] = deque(maxlen=10000)
+        self._labels: Dict[CodeType, str] = {}
+        self._stop_event = threading.Event()
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(ROOT):
+                path = os.path.relpath(path, ROOT)
+            else:
+                path = os.path.basename(path)
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        return label
+
+    def _owner(self, frames: List[FrameType]) -> Optional[str]:
+        """Обработчик aiogram на стеке, иначе самая глубокая функция бота"""
+        own = None
+        for frame in reversed(frames):
+            code = frame.f_code
+            name = self.handler_names.get(code)
+            if name is not None:
+                return name
+            if own is None and code.co_filename.startswith(ROOT):
+                own = f"{os.path.splitext(os.path.relpath(code.co_filename, ROOT))[0]}.{code.co_name}"
+        return own
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            self.stacks[";".join(self._label(f.f_code) for f in frames)] += 1
+            self.recent.append((time.monotonic(), self._owner(frames)))
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+    def owner_since(self, since: float) -> Optional[str]:
+        """Чаще всего встречавшийся на стеке обработчик начиная с момента since"""
+        owners = Counter(owner for at, owner in list(self.recent) if at >= since and owner)
+        return owners.most_common(1)[0][0] if owners else None
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class _SlowCallbackHandler(logging.Handler):
+    """Ловит предупреждения asyncio debug «Executing <...> took N seconds»"""
+
+    def __init__(self, profiler: "LoopProfiler", sampler: StackSampler):
+        super().__init__(level=logging.WARNING)
+        self.profiler = profiler
+        self.sampler = sampler
+
+    def emit(self, record: logging.LogRecord):
+        if not str(record.msg).startswith("Executing") or len(record.args or ()) < 2:
+            return
+        callback, seconds = record.args[0], float(record.args[-1])
+        # Предупреждение пишется сразу после медленного шага — смотрим снимки за это время
+        owner = self.sampler.owner_since(time.monotonic() - seconds) or "неизвестно"
+        self.profiler.slow_callbacks.append({
+            "handler": owner,
+            "seconds": round(seconds, 3),
+            "at": time.time(),
+            "callback": str(callback)[:300],
+        })
+        logger.warning(f"🐢 Цикл событий заблокирован на {seconds * 1000:.0f} мс: {owner}")
+
+class LoopProfiler:
+    """
+    Профилирование работающего процесса по запросу: семплирование стека
+    цикла событий и включённый на время замера asyncio debug, который
+    сообщает о шагах дольше slow_threshold. Для медленного шага по снимкам
+    стека определяется обработчик (handle_answer, process_broadcast, …).
+    """
+
+    def __init__(self, interval: float = 0.005, slow_threshold: float = 0.1, max_slow: int = 200):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.slow_callbacks: Deque[dict] = deque(maxlen=max_slow)
+        self.handler_names: Dict[CodeType, str] = {}
+        self.running = False
+
+    def register_handlers(self, dispatcher):
+        """Код обработчиков всех роутеров — по нему обработчик узнаётся на стеке"""
+        for router in dispatcher.chain_tail:
+            for observer in router.observers.values():
+                for handler in observer.handlers:
+                    code = getattr(handler.callback, "__code__", None)
+                    if code is not None:
+                        self.handler_names[code] = handler.callback.__name__
+
+    async def profile(self, seconds: float, interval: Optional[float] = None) -> Tuple[str, int, List[dict]]:
+        """Замер на seconds секунд: (collapsed stacks, число снимков, медленные шаги за замер)"""
+        if self.running:
+            raise RuntimeError("Профилирование уже идёт")
+        interval = self.interval if interval is None else interval
+        # nan проходит через min/max без изменений
+        if not math.isfinite(seconds) or not math.isfinite(interval):
+            raise ValueError("seconds и interval должны быть конечными числами")
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        interval = max(interval, MIN_PROFILE_INTERVAL)
+        self.running = True
+        loop = asyncio.get_running_loop()
+        sampler = StackSampler(threading.get_ident(), interval, self.handler_names)
+        log_handler = _SlowCallbackHandler(self, sampler)
+        asyncio_logger = logging.getLogger("asyncio")
+        debug, slow_duration = loop.get_debug(), loop.slow_callback_duration
+        started = time.time()
+        asyncio_logger.addHandler(log_handler)
+        loop.slow_callback_duration = self.slow_threshold
+        loop.set_debug(True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            loop.set_debug(debug)
+            loop.slow_callback_duration = slow_duration
+            asyncio_logger.removeHandler(log_handler)
+            await asyncio.to_thread(sampler.join)
+            self.running = False
+        found = [event for event in self.slow_callbacks if event["at"] >= started]
+        return sampler.collapsed(), sampler.samples, found
+
+loop_profiler = LoopProfiler(slow_threshold=Config.PROFILE_SLOW_CALLBACK)
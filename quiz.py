@@ -0,0 +1,101 @@
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from database import ANSWER_CODES
+from texts.questions import QUESTIONS, OPTIONS
+
+class Quiz:
+    """
+    Тест, собранный из определений вопросов и вариантов ответа.
+    Позиция в тесте — число данных ответов, поэтому переход вперёд
+    и назад — это добавить или убрать один символ в конце строки ответов.
+    """
+
+    def __init__(self, quiz_id: str, questions: Sequence[str], options: Sequence[Sequence[Tuple[str, str]]]):
+        if not questions or len(questions) != len(options):
+            raise ValueError(f"Тест {quiz_id}: число вопросов и наборов вариантов не совпадает")
+        self.id = quiz_id
+        self.questions = tuple(questions)
+        self.options = tuple(tuple(question_options) for question_options in options)
+        # Для каждого вопроса: код варианта → номер кнопки
+        self.option_codes = tuple(
+            {code: i for i, (_, code) in enumerate(question_options)}
+            for question_options in self.options
+        )
+        if any(len(code) != 1 for codes in self.option_codes for code in codes):
+            raise ValueError(f"Тест {quiz_id}: код варианта должен быть одним символом")
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def is_option(self, q_index: int, code: str) -> bool:
+        return 0 <= q_index < len(self.questions) and code in self.option_codes[q_index]
+
+QUIZZES: Dict[str, Quiz] = {}
+DEFAULT_QUIZ = "main"
+
+def register_quiz(quiz: Quiz) -> Quiz:
+    """
+    Регистрация теста. Ответы хранятся в answers_packed, а результат считается
+    по категориям ANSWER_CODES, поэтому другие коды вариантов не принимаются.
+    Результат, аналитика и уведомление админу пишутся только для DEFAULT_QUIZ:
+    колонки users и воронка рассчитаны на один тест
+    """
+    unknown = {code for codes in quiz.option_codes for code in codes} - set(ANSWER_CODES)
+    if unknown:
+        raise ValueError(f"Тест {quiz.id}: коды вариантов {''.join(sorted(unknown))} вне {''.join(ANSWER_CODES)}")
+    QUIZZES[quiz.id] = quiz
+    return quiz
+
+register_quiz(Quiz(DEFAULT_QUIZ, QUESTIONS, OPTIONS))
+
+class QuizSession(NamedTuple):
+    """
+    Прохождение теста одним пользователем. В FSM хранится целиком
+    одной записью: {"quiz": id, "answers": "ABA", "reached": 3}
+    """
+    quiz: Quiz
+    answers: str = ""
+    # Сколько вопросов отвечено в этой попытке хотя бы раз (для воронки)
+    reached: int = 0
+
+    @property
+    def position(self) -> int:
+        return len(self.answers)
+
+    @property
+    def finished(self) -> bool:
+        return len(self.answers) >= len(self.quiz)
+
+    @property
+    def is_default(self) -> bool:
+        """Основной тест: только его результат сохраняется и попадает в аналитику"""
+        return self.quiz.id == DEFAULT_QUIZ
+
+    @property
+    def question(self) -> str:
+        return self.quiz.questions[self.position]
+
+    def answer(self, code: str) -> "QuizSession":
+        answers = self.answers + code
+        return self._replace(answers=answers, reached=max(self.reached, len(answers)))
+
+    def back(self) -> Tuple["QuizSession", str]:
+        """Шаг назад; возвращает и отменённый ответ"""
+        return self._replace(answers=self.answers[:-1]), self.answers[-1]
+
+    def to_data(self) -> Dict[str, Any]:
+        return {"quiz": self.quiz.id, "answers": self.answers, "reached": self.reached}
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> Optional["QuizSession"]:
+        """Сессия из данных FSM; None — пользователь не проходит тест"""
+        answers = data.get("answers")
+        if answers is None:
+            return None
+        quiz = QUIZZES.get(data.get("quiz", DEFAULT_QUIZ))
+        if quiz is None:
+            return None
+        # До движка тестов ответы хранились списком
+        if isinstance(answers, list):
+            answers = "".join(answers)
+        return cls(quiz, answers, data.get("reached", len(answers)))
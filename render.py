@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from keyboards.inline import warm_up_keyboards
+from texts.results import RESULT_HEADERS, RESULT_INTERPRETATIONS, FINAL_MESSAGE
+
+# Готовые экраны результата A/B/C, собираются один раз в warm_up()
+RESULT_SCREENS: Dict[str, str] = {}
+
+def render_result(result: str) -> str:
+    return (
+        "✅ <b>Тест завершён</b>\n\n"
+        f"{RESULT_HEADERS[result]}\n\n"
+        f"{RESULT_INTERPRETATIONS[result]}\n\n"
+        f"{FINAL_MESSAGE}"
+    )
+
+def result_screen(result: str) -> str:
+    screen = RESULT_SCREENS.get(result)
+    if screen is None:
+        screen = RESULT_SCREENS[result] = render_result(result)
+    return screen
+
+def warm_up():
+    """Предварительная сборка клавиатур и экранов результата"""
+    warm_up_keyboards()
+    for result in RESULT_HEADERS:
+        result_screen(result)
+
+class RenderedMessages:
+    """
+    Отпечатки содержимого сообщений бота: (chat_id, message_id) -> hash(текст, клавиатура).
+    Позволяют не отправлять edit_text, который ничего не изменит.
+    Отпечатки у каждого процесса свои, а сообщение может править любой воркер,
+    поэтому с несколькими воркерами пропуск выключается (enabled=False) и
+    лишнюю правку отсекает ответ Telegram «message is not modified».
+    """
+
+    def __init__(self, max_size: int = 100000, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._fingerprints: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        # Клавиатуры закэшированы, поэтому их отпечаток считается один раз на объект
+        self._markup_fingerprints: Dict[int, Tuple[InlineKeyboardMarkup, int]] = {}
+        self.skipped = 0
+        self.not_modified = 0
+
+    def _markup_fingerprint(self, markup: Optional[InlineKeyboardMarkup]) -> int:
+        if markup is None:
+            return 0
+        cached = self._markup_fingerprints.get(id(markup))
+        if cached is not None and cached[0] is markup:
+            return cached[1]
+        fingerprint = hash(markup.model_dump_json())
+        if len(self._markup_fingerprints) < 1024:
+            self._markup_fingerprints[id(markup)] = (markup, fingerprint)
+        return fingerprint
+
+    def fingerprint(self, text: str, markup: Optional[InlineKeyboardMarkup]) -> int:
+        return hash((text, self._markup_fingerprint(markup)))
+
+    def remember(self, message: Message, text: str, markup: Optional[InlineKeyboardMarkup]):
+        if not self.enabled:
+            return
+        key = (message.chat.id, message.message_id)
+        self._fingerprints[key] = self.fingerprint(text, markup)
+        self._fingerprints.move_to_end(key)
+        if len(self._fingerprints) > self.max_size:
+            self._fingerprints.popitem(last=False)
+
+    def is_same(self, message: Message, text: str, markup: Optional[InlineKeyboardMarkup]) -> bool:
+        if not self.enabled:
+            return False
+        current = self._fingerprints.get((message.chat.id, message.message_id))
+        return current is not None and current == self.fingerprint(text, markup)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tracked": len(self._fingerprints),
+            "skipped": self.skipped,
+            "not_modified": self.not_modified,
+        }
+
+rendered_messages = RenderedMessages()
+
+async def edit_text(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+    """edit_text, который пропускает правку без изменений. Возвращает True, если правка ушла в API"""
+    if rendered_messages.is_same(message, text, reply_markup):
+        rendered_messages.skipped += 1
+        return False
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        # Содержимое не известно заранее (например, после перезапуска) — Telegram сам сообщит
+        if "message is not modified" not in str(e):
+            raise
+        rendered_messages.not_modified += 1
+    rendered_messages.remember(message, text, reply_markup)
+    return True
+
+async def answer_message(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> Message:
+    """message.answer с запоминанием отпечатка отправленного сообщения"""
+    sent = await message.answer(text, reply_markup=reply_markup)
+    rendered_messages.remember(sent, text, reply_markup)
+    return sent
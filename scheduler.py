@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UPDATE_LAG_SECONDS = metrics.histogram(
+    "update_queue_lag_seconds", "Время апдейта в очереди до начала обработки")
+
+# Поля update, в которых лежит объект с автором (from)
+USER_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+def update_order_key(update: Dict[str, Any]) -> Any:
+    """Ключ упорядочивания: апдейты одного пользователя обрабатываются строго по очереди"""
+    for field in USER_UPDATE_FIELDS:
+        event = update.get(field)
+        if event:
+            user = event.get("from") or event.get("user")
+            if user:
+                return user["id"]
+            chat = event.get("chat")
+            if chat:
+                return chat["id"]
+    # Апдейты без пользователя (посты каналов, опросы) ни с чем не связаны
+    return ("update", update.get("update_id"))
+
+class UpdateScheduler:
+    """
+    Ограниченная очередь апдейтов с пулом обработчиков.
+    Разные пользователи обрабатываются параллельно, апдейты одного
+    пользователя — по одному в порядке поступления. Когда очередь
+    заполнена, submit возвращает False, и webhook отвечает 503.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[None]],
+        workers: int = 16,
+        max_size: int = 1000,
+    ):
+        self.process = process
+        self.workers = workers
+        self.max_size = max_size
+        # Очередь каждого пользователя и очередь ключей, готовых к обработке
+        self._queues: Dict[Any, Deque[Tuple[Dict[str, Any], float]]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._idle: Optional[asyncio.Event] = None
+        self.depth = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 25.0):
+        """Дожидаемся принятых апдейтов (Telegram их уже не пришлёт повторно), затем гасим пул"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано апдейтов при остановке: {self.depth + self.in_flight}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, update: Dict[str, Any]) -> bool:
+        if self.depth >= self.max_size:
+            self.rejected += 1
+            return False
+        key = update_order_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            # Пользователь не в обработке — ключ сразу готов
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, time.monotonic()))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.accepted += 1
+        self._idle.clear()
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            update, enqueued_at = queue.popleft()
+            self.depth -= 1
+            self.in_flight += 1
+            lag = time.monotonic() - enqueued_at
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._total_lag += lag
+            UPDATE_LAG_SECONDS.observe(lag)
+            try:
+                await self.process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+            finally:
+                self.in_flight -= 1
+                # Следующий апдейт этого пользователя — только после текущего
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
+                if not self.depth and not self.in_flight:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        started = self.processed + self.failed
+        return {
+            "workers": self.workers,
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "users": len(self._queues),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_lag_ms": self.last_lag * 1000,
+            "avg_lag_ms": self._total_lag / started * 1000 if started else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+        }
+
+class ScheduledRequestHandler(SimpleRequestHandler):
+    """Webhook-обработчик: сразу отвечает Telegram и отдаёт апдейт в UpdateScheduler"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 16, max_size: int = 1000, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **data)
+        self.scheduler = UpdateScheduler(self._process, workers=workers, max_size=max_size)
+
+    async def _process(self, update: Dict[str, Any]):
+        await self._background_feed_update(self.bot, update)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if not self.scheduler.running:
+            self.scheduler.start()
+        update = await request.json(loads=bot.session.json_loads)
+        if not self.scheduler.submit(update):
+            # Telegram повторит доставку позже
+            return web.Response(status=503, text="Update queue is full")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self):
+        await self.scheduler.stop()
+        await super().close()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import Config
+from database import ANSWER_BITS, ANSWER_CODES, ANSWER_LETTERS, ANSWER_MASK, Database
+from quiz import DEFAULT_QUIZ, QUIZZES
+
+class ScoringModel:
+    """
+    Подсчёт результата теста: каждый ответ добавляет вес своей категории
+    (категория = буква варианта), побеждает категория с наибольшей суммой.
+    Вес задаётся на пару «вопрос, вариант», ничья решается порядком tie_break.
+    С весами 1 и порядком ABC — прежнее большинство голосов с приоритетом A > B > C.
+    """
+
+    def __init__(self, questions: int, weights: Optional[Dict[int, Dict[str, float]]] = None,
+                 default_weight: float = 1.0, tie_break: str = "ABC"):
+        if sorted(tie_break) != sorted(ANSWER_CODES):
+            raise ValueError(f"tie_break должен содержать {''.join(ANSWER_CODES)} по одному разу")
+        self.questions = questions
+        self.tie_break = tie_break
+        # weights[номер вопроса с 0][код варианта]; столбец 0 — «нет ответа»
+        self.weights: List[List[float]] = [
+            [0.0] + [default_weight] * len(ANSWER_CODES) for _ in range(questions)
+        ]
+        for number, options in (weights or {}).items():
+            if not 1 <= number <= questions:
+                raise ValueError(f"В тесте нет вопроса {number}")
+            for option, weight in options.items():
+                if option not in ANSWER_CODES:
+                    raise ValueError(f"Вопрос {number}: неизвестный вариант {option}")
+                self.weights[number - 1][ANSWER_CODES[option]] = float(weight)
+
+    @classmethod
+    def from_file(cls, path: str, questions: int) -> "ScoringModel":
+        """
+        JSON вида {"tie_break": "BAC", "default_weight": 1,
+        "weights": {"3": {"B": 2}, "8": {"C": 1.5}}} — номера вопросов с 1
+        """
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(
+            questions,
+            weights={int(number): options for number, options in config.get("weights", {}).items()},
+            default_weight=config.get("default_weight", 1.0),
+            tie_break=config.get("tie_break", "ABC"),
+        )
+
+    def score(self, answers: Sequence[str]) -> str:
+        totals = dict.fromkeys(ANSWER_CODES, 0.0)
+        for q_index, answer in enumerate(answers[:self.questions]):
+            totals[answer] += self.weights[q_index][ANSWER_CODES[answer]]
+        # max возвращает первый из равных — порядок обхода и есть tie_break
+        return max(self.tie_break, key=totals.__getitem__)
+
+    def score_packed(self, packed):
+        """
+        Векторный подсчёт для массива answers_packed (numpy int64).
+        Возвращает массив кодов результата (ANSWER_CODES)
+        """
+        import numpy as np
+
+        packed = np.asarray(packed, dtype=np.int64)
+        weights = np.asarray(self.weights)
+        totals = np.zeros((len(packed), len(ANSWER_CODES) + 1))
+        rows = np.arange(len(packed))
+        for q_index in range(self.questions):
+            codes = (packed >> (ANSWER_BITS * q_index)) & ANSWER_MASK
+            # Вес ответа — в столбец его категории; «нет ответа» уходит в столбец 0
+            totals[rows, codes] += weights[q_index, codes]
+        # Столбцы в порядке tie_break: argmax берёт первый из равных
+        order = np.array([ANSWER_CODES[option] for option in self.tie_break])
+        return order[np.argmax(totals[:, order], axis=1)]
+
+def load_scoring_model() -> ScoringModel:
+    questions = len(QUIZZES[DEFAULT_QUIZ])
+    if Config.SCORING_CONFIG:
+        return ScoringModel.from_file(Config.SCORING_CONFIG, questions)
+    return ScoringModel(questions)
+
+scoring_model = load_scoring_model()
+
+class RescoreReport(NamedTuple):
+    scored: int
+    changed: int
+    # (старый результат, новый) -> сколько пользователей
+    transitions: Dict[Tuple[Optional[str], str], int]
+    # Строки, которые ещё ждут конвертации в answers_packed
+    skipped: int
+
+# Пересчёт идёт не больше одного за раз
+rescore_lock = asyncio.Lock()
+
+async def rescore_users(model: ScoringModel, dry_run: bool = True,
+                        chunk_size: int = Config.RESCORE_CHUNK_SIZE) -> RescoreReport:
+    """
+    Пересчёт сохранённых результатов по модели. Ответы читаются страницами
+    по id, каждая страница считается одним векторным проходом, изменения
+    пишутся одной транзакцией на страницу. dry_run — только отчёт
+    """
+    import numpy as np
+
+    db = Database()
+    scored = changed = 0
+    transitions: Dict[Tuple[Optional[str], str], int] = {}
+    last_id = 0
+    while True:
+        ids, packed, old_codes = await db.get_scoring_chunk(last_id, chunk_size)
+        if not ids:
+            break
+        last_id = ids[-1]
+        ids = np.asarray(ids, dtype=np.int64)
+        packed = np.asarray(packed, dtype=np.int64)
+        old_codes = np.asarray(old_codes, dtype=np.int64)
+        new_codes = model.score_packed(packed)
+        mask = new_codes != old_codes
+        scored += len(ids)
+        changed += int(mask.sum())
+        if mask.any():
+            pairs, counts = np.unique(np.stack((old_codes[mask], new_codes[mask])), axis=1, return_counts=True)
+            for (old, new), count in zip(pairs.T.tolist(), counts.tolist()):
+                key = (ANSWER_LETTERS.get(old), ANSWER_LETTERS[new])
+                transitions[key] = transitions.get(key, 0) + count
+            if not dry_run:
+                await db.save_result_codes(list(zip(
+                    new_codes[mask].tolist(), ids[mask].tolist(), packed[mask].tolist()
+                )))
+    skipped = await db.count_unconverted_results()
+    return RescoreReport(scored, changed, transitions, skipped)
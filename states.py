@@ -1,12 +1,5 @@
 from aiogram.fsm.state import State, StatesGroup
 
 class TestStates(StatesGroup):
-    q1 = State()
-    q2 = State()
-    q3 = State()
-    q4 = State()
-    q5 = State()
-    q6 = State()
-    q7 = State()
-    q8 = State()
+    quiz = State()  # Прохождение теста: позиция и ответы — в данных FSM (quiz.QuizSession)
     broadcast = State()  # Для админской рассылки
\ No newline at end of file
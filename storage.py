@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class CachedRecord:
+    __slots__ = ("state", "data", "touched_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data or {}
+        self.touched_at = time.monotonic()
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в файле бота (SQLite) с кэшем в памяти.
+    Чтения обслуживаются из кэша, запись сквозная: set_state и set_data
+    возвращаются, только когда запись уже в БД, поэтому следующий апдейт
+    пользователя, попавший в другой воркер, прочитает новое состояние.
+    state и data ключа всегда пишутся вместе одним upsert.
+    Кэш — LRU не больше max_size записей, пустые состояния в нём не хранятся.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        idle_ttl: float = 86400,
+        cache_reads: bool = True,
+        max_size: int = 100000,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.db = db
+        self.idle_ttl = idle_ttl
+        # Несколько процессов не видят кэш друг друга — тогда читаем из БД
+        self.cache_reads = cache_reads
+        self.max_size = max_size
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cache: "OrderedDict[str, CachedRecord]" = OrderedDict()
+        # Ключи с записью в процессе: число незавершённых записей
+        self._writing: Dict[str, int] = {}
+        self._sweeper_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запуск фоновой очистки брошенных сессий"""
+        if self._sweeper_task is None and self.idle_ttl > 0:
+            self._sweeper_task = asyncio.create_task(self._sweep_forever())
+
+    async def close(self):
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            await asyncio.gather(self._sweeper_task, return_exceptions=True)
+            self._sweeper_task = None
+
+    @property
+    def shared(self) -> bool:
+        """Видят ли другие процессы изменения сразу: запись сквозная, кэш чтений выключен"""
+        return not self.cache_reads
+
+    async def _record(self, key: StorageKey) -> CachedRecord:
+        name = self.key_builder.build(key)
+        record = self._cache.get(name)
+        if record is None or (not self.cache_reads and name not in self._writing):
+            row = await self.db.get_fsm_record(name)
+            record = CachedRecord(row[0], json.loads(row[1]) if row and row[1] else {}) if row else CachedRecord()
+            self._cache[name] = record
+        self._cache.move_to_end(name)
+        self._evict()
+        record.touched_at = time.monotonic()
+        return record
+
+    def _evict(self):
+        """Вытеснение самых давних записей сверх max_size; записываемые не трогаем"""
+        excess = len(self._cache) - self.max_size
+        if excess <= 0:
+            return
+        for name in list(itertools.islice(self._cache, excess + len(self._writing))):
+            if name not in self._writing:
+                del self._cache[name]
+                excess -= 1
+                if excess == 0:
+                    break
+
+    async def _save(self, key: StorageKey, record: CachedRecord):
+        """
+        Сквозная запись ключа. Параметры берутся до ожидания блокировки записи,
+        а писатель обслуживает очередь по порядку, поэтому в БД остаётся последнее
+        изменение. При ошибке ключ убирается из кэша (там значение новее БД),
+        а исключение уходит в обработчик
+        """
+        name = self.key_builder.build(key)
+        if record.state is None and not record.data:
+            upserts, deletes = [], [name]
+        else:
+            upserts, deletes = [(name, record.state, json.dumps(record.data, ensure_ascii=False), time.time())], []
+        self._writing[name] = self._writing.get(name, 0) + 1
+        try:
+            await self.db.save_fsm_records(upserts, deletes)
+        except BaseException:
+            self._cache.pop(name, None)
+            raise
+        finally:
+            self._writing[name] -= 1
+            if not self._writing[name]:
+                del self._writing[name]
+        # Пустое состояние (state.clear()) в БД удалено — в кэше оно не нужно
+        current = self._cache.get(name)
+        if deletes and current is record and name not in self._writing and current.state is None and not current.data:
+            del self._cache[name]
+
+    async def set_state(self, key: StorageKey, state: StateType = None):
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._save(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]):
+        record = await self._record(key)
+        record.data = data.copy()
+        await self._save(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def _sweep_forever(self):
+        interval = min(max(self.idle_ttl / 4, 1), 300)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки FSM: {e}")
+
+    async def sweep(self):
+        """Удаление сессий, которые не менялись дольше idle_ttl"""
+        cutoff = time.monotonic() - self.idle_ttl
+        for name in [name for name, record in self._cache.items() if record.touched_at < cutoff]:
+            if name not in self._writing:
+                del self._cache[name]
+        await self.db.delete_idle_fsm_records(time.time() - self.idle_ttl)
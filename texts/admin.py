@@ -8,22 +8,180 @@ ADMIN_NEW_USER_NOTIFICATION = (
     "<b>Ответы:</b>\n{answers}"
 )
 
+ADMIN_DIGEST_HEADER = "🔔 <b>Диагностику прошли: {count}</b> ({start}–{end})\n\n"
+
+ADMIN_DIGEST_ITEM = (
+    "🕐 {time} · <code>{user_id}</code> · {full_name} ({username})\n"
+    "📊 «{result}» · {answers}\n"
+)
+
+ADMIN_DIGEST_DROPPED = "\n⚠️ Не поместилось в очередь уведомлений: {count}"
+
+ADMIN_DIAG_SCHEDULER = (
+    "\n<b>Очередь апдейтов:</b>\n"
+    "• В очереди: {depth} из {max_size} (макс. {max_depth}), в работе: {in_flight}/{workers}\n"
+    "• Принято: {accepted}, отклонено (503): {rejected}, ошибок: {failed}\n"
+    "• Задержка: посл. {last_lag_ms:.1f} мс, сред. {avg_lag_ms:.1f} мс, макс. {max_lag_ms:.1f} мс\n"
+)
+
+ADMIN_DIAG_DEDUP = (
+    "\n<b>Повторы апдейтов:</b>\n"
+    "• Отброшено повторных доставок: {dropped_updates}, двойных нажатий: {dropped_callbacks}\n"
+    "• Отслеживается: апдейтов {tracked_updates}, нажатий {tracked_callbacks}\n"
+)
+
+ADMIN_DIAG_THROTTLING = (
+    "\n<b>Ограничение частоты:</b>\n"
+    "• Пропущено: {allowed}, отброшено: {throttled}\n"
+    "• Сообщения: {throttled_message}, ответы: {throttled_answer}, "
+    "проверка подписки: {throttled_subscription}, кнопки: {throttled_callback}\n"
+    "• Корзин: {tracked}, удалено простаивающих: {evicted}\n"
+)
+
+ADMIN_DIAG_NOTIFIER = (
+    "\n<b>Уведомления админу:</b>\n"
+    "• В очереди: {pending}, отправлено сообщений: {sent}, из них сводок: {digests}\n"
+    "• Потеряно из-за переполнения: {dropped}, ошибок отправки: {failed}\n"
+)
+
 ADMIN_BROADCAST_START = (
     "📧 <b>Режим рассылки активирован</b>\n\n"
     "Отправьте сообщение для рассылки всем пользователям.\n\n"
     "❌ Для отмены: /cancel"
 )
 
+ADMIN_BROADCAST_PROGRESS = (
+    "📤 <b>Рассылка идёт...</b>\n\n"
+    "📨 Обработано: {done} из {total}\n"
+    "✅ Успешно: {success}\n"
+    "🚫 Заблокировали бота: {blocked}\n"
+    "❌ Неудачно: {failed}\n"
+    "⏱ Прошло: {elapsed} с"
+)
+
 ADMIN_BROADCAST_COMPLETE = (
     "✅ <b>Рассылка завершена!</b>\n\n"
     "👥 Всего: {total}\n"
     "✅ Успешно: {success}\n"
+    "🚫 Заблокировали бота: {blocked}\n"
+    "❌ Неудачно: {failed}\n"
+    "⏱ Время: {elapsed} с"
+)
+
+ADMIN_BROADCAST_STATUS = (
+    "📧 <b>Рассылка #{job_id}</b> — {status}\n\n"
+    "🕒 Создана: {created_at}\n"
+    "👥 Получателей: {total}\n"
+    "⏳ В очереди: {pending}\n"
+    "✅ Успешно: {success}\n"
+    "🚫 Заблокировали бота: {blocked}\n"
     "❌ Неудачно: {failed}"
 )
 
+ADMIN_BROADCAST_STATUS_LABELS = {
+    "preparing": "собирается список получателей",
+    "running": "идёт",
+    "done": "завершена",
+    "cancelled": "отменена",
+}
+
+ADMIN_BROADCAST_NOT_FOUND = "Рассылок пока не было"
+
+ADMIN_BROADCAST_CANCELLED = "⛔️ Рассылка #{job_id} отменена. Неотправленным получателям сообщение не уйдёт."
+
+ADMIN_BROADCAST_NOT_RUNNING = "Рассылка #{job_id} не выполняется"
+
+ADMIN_BROADCAST_ABANDONED = (
+    "⛔️ Рассылка #{job_id} отменена: бот перезапустился, пока собирался список получателей. "
+    "Отправьте сообщение для рассылки ещё раз."
+)
+
 ADMIN_STATS = (
     "📊 <b>Статистика бота</b>\n\n"
     "👥 Всего пользователей: <b>{total}</b>\n"
-    "🆕 Прошли тест сегодня: <b>{today}</b>\n\n"
+    "✅ Прошли тест: <b>{completed}</b> ({completion_rate:.1f}%)\n"
+    "🏁 Прошли тест сегодня: <b>{completed_today}</b>\n\n"
+    "🆕 <b>Новые пользователи:</b>\n"
+    "• сегодня: <b>{today}</b>\n"
+    "• за 7 дней: <b>{week}</b>\n"
+    "• за 30 дней: <b>{month}</b>\n\n"
     "<b>Последние пользователи сегодня:</b>"
-)
\ No newline at end of file
+)
+
+ADMIN_DIAG = "🛠 <b>Диагностика</b>\n"
+
+ADMIN_DIAG_WRITE_QUEUE = (
+    "\n<b>Отложенная запись в БД:</b> {mode}\n"
+    "• В очереди: {depth}\n"
+    "• Сбросов: {flushes}, строк: {rows_flushed}, ошибок: {failed_rows}\n"
+    "• Время сброса: посл. {last_flush_ms:.1f} мс, "
+    "сред. {avg_flush_ms:.1f} мс, макс. {max_flush_ms:.1f} мс\n"
+)
+
+ADMIN_DIAG_REPLICA = (
+    "\n<b>Реплика для админки:</b>\n"
+    "• Возраст снимка: {age} (допустимо {max_lag:.0f} с)\n"
+    "• Снимков: {snapshots}, последний за {last_snapshot_ms:.0f} мс, перезапусков копирования: {restarts}\n"
+    "• Чтений из реплики: {replica_reads}, из основной базы: {fallbacks}\n"
+)
+
+ADMIN_DIAG_SUBSCRIPTION_CACHE = (
+    "\n<b>Кэш проверки подписки:</b>\n"
+    "• Записей: {size}, вытеснено: {evictions}\n"
+    "• Попаданий: {hits}, промахов: {misses}, объединено: {coalesced}\n"
+    "• Ошибок API: {errors}, отдано устаревших: {stale_served}\n"
+)
+
+ADMIN_DIAG_RENDER = (
+    "\n<b>Правки сообщений:</b>\n"
+    "• Отслеживается сообщений: {tracked}\n"
+    "• Пропущено правок без изменений: {skipped}\n"
+    "• Ответов «message is not modified»: {not_modified}\n"
+)
+
+ADMIN_FUNNEL = "📈 <b>Воронка теста</b>\n\n🚀 Начали тест: <b>{started}</b>\n"
+
+ADMIN_FUNNEL_STEP = "{number}. Ответили: <b>{reached}</b> ({percent:.0f}%), ушли: {dropped}\n"
+
+ADMIN_FUNNEL_OPTIONS = "\n📊 <b>Распределение ответов</b>\n"
+
+ADMIN_FUNNEL_OPTIONS_ROW = "{number}. {options}\n"
+
+ADMIN_FUNNEL_EMPTY = "Пока никто не начинал тест"
+
+ADMIN_EXPORT_USAGE = (
+    "📦 <b>Выгрузка пользователей</b>\n\n"
+    "<code>/export [csv|jsonl] [A|B|C] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]</code>\n\n"
+    "Аргументы в любом порядке, все необязательны. Даты — период регистрации, "
+    "буква — результат теста. Пример: <code>/export jsonl B 2024-01-01 2024-01-31</code>"
+)
+
+ADMIN_EXPORT_STARTED = "⏳ Готовлю выгрузку…"
+
+ADMIN_EXPORT_BUSY = "⏳ Предыдущая выгрузка ещё не закончилась, попробуйте позже"
+
+ADMIN_EXPORT_EMPTY = "По этим условиям пользователей нет"
+
+ADMIN_EXPORT_DONE = "📦 Пользователей: {rows}, размер: {size_kb:.0f} КБ"
+
+ADMIN_EXPORT_TOO_LARGE = (
+    "❌ Архив получился {size_mb:.1f} МБ — больше лимита Telegram в 50 МБ. "
+    "Сузьте период или выберите результат"
+)
+
+ADMIN_RESCORE_DRY_RUN = "🧮 <b>Пересчёт результатов (проверка)</b>\n\n"
+
+ADMIN_RESCORE_APPLIED = "🧮 <b>Результаты пересчитаны</b>\n\n"
+
+ADMIN_RESCORE_REPORT = (
+    "👥 Проверено тестов: <b>{scored}</b>\n"
+    "🔄 Меняют результат: <b>{changed}</b>\n"
+)
+
+ADMIN_RESCORE_TRANSITION = "• {old} → {new}: {count}\n"
+
+ADMIN_RESCORE_SKIPPED = "\n⏳ Ещё не сконвертировано (пропущено): {skipped}\n"
+
+ADMIN_RESCORE_HINT = "\nЧтобы записать новые результаты: /rescore apply"
+
+ADMIN_RESCORE_BUSY = "⏳ Пересчёт уже идёт, попробуйте позже"
@@ -1,3 +1,9 @@
+RESULT_HEADERS = {
+    "A": "◽️ <b>Результат: «Тихий тупик»</b>",
+    "B": "◾️ <b>Результат: «Перегруженная женщина»</b>",
+    "C": "▪️ <b>Результат: «Подавленная близость»</b>"
+}
+
 RESULT_INTERPRETATIONS = {
     "A": (
         "«<b>Тихий тупик</b>»\n\n"
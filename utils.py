@@ -1,21 +1,32 @@
-from collections import Counter
+import logging
+import time
 from typing import List
 from aiogram import Bot
+from cache import TTLCache
 from config import Config
+from database import Database
+from scoring import scoring_model
+
+logger = logging.getLogger(__name__)
+
+db = Database()
+
+MEMBER_STATUSES = ("member", "administrator", "creator", "owner")
+
+# Кэш статусов подписки: user_id -> bool
+subscription_cache = TTLCache(
+    max_size=Config.SUB_CACHE_SIZE,
+    positive_ttl=Config.SUB_CACHE_POSITIVE_TTL,
+    negative_ttl=Config.SUB_CACHE_NEGATIVE_TTL,
+    stale_ttl=Config.SUB_CACHE_STALE_TTL,
+)
 
 def calculate_result(answers: List[str]) -> str:
     """
-    Расчет результата теста на основе ответов.
-    В случае ничьей выбираем первый вариант по приоритету A > B > C
+    Расчет результата теста на основе ответов — по модели из scoring.py
+    (веса вариантов и порядок при ничьей задаются в SCORING_CONFIG)
     """
-    counts = Counter(answers)
-    max_count = max(counts.values())
-    
-    for option in ["A", "B", "C"]:
-        if counts.get(option, 0) == max_count:
-            return option
-    
-    return "B"  # Фолбэк
+    return scoring_model.score(answers)
 
 def format_answers_for_admin(answers: List[str]) -> str:
     """Форматирование ответов для админского уведомления с красивым оформлением"""
@@ -37,16 +48,47 @@ def format_answers_for_admin(answers: List[str]) -> str:
     
     return "\n\n".join(formatted)
 
-async def check_subscription(bot: Bot, user_id: int) -> bool:
+def format_answers_compact(answers: List[str]) -> str:
+    """Ответы одной строкой для сводки: 1A 2B 3C ..."""
+    return " ".join(f"{i}{ans}" for i, ans in enumerate(answers, 1))
+
+def is_member_status(member) -> bool:
+    """Подписан ли участник: restricted тоже может оставаться в канале"""
+    if member.status == "restricted":
+        return bool(getattr(member, "is_member", False))
+    return member.status in MEMBER_STATUSES
+
+async def check_subscription(bot: Bot, user_id: int, recheck: bool = False) -> bool:
     """
     Проверка подписки пользователя на канал.
     Возвращает True, если пользователь подписан.
+    Результат кэшируется; recheck=True игнорирует закэшированный отказ.
     
     Важно: бот должен быть админом канала!
     """
+    async def load() -> bool:
+        # Сначала локальное зеркало подписок (апдейты chat_member и сверка).
+        # Отказу при recheck не верим: апдейт о вступлении мог ещё не прийти
+        mirrored = await db.get_membership(user_id)
+        if mirrored is not None:
+            is_member, updated_at = mirrored
+            if time.time() - updated_at < Config.MEMBERSHIP_MAX_AGE and (is_member or not recheck):
+                return is_member
+        try:
+            member = await bot.get_chat_member(
+                Config.CHANNEL_ID, user_id, request_timeout=Config.SUBSCRIPTION_API_TIMEOUT
+            )
+        except Exception:
+            # Bot API недоступен или медленный — лучше устаревший статус, чем отказ
+            if mirrored is not None:
+                return mirrored[0]
+            raise
+        is_member = is_member_status(member)
+        await db.save_memberships([(user_id, member.status, is_member, time.time())])
+        return is_member
+    
     try:
-        member = await bot.get_chat_member(Config.CHANNEL_ID, user_id)
-        return member.status in ["member", "administrator", "creator", "owner"]
+        return await subscription_cache.get(user_id, load, bypass_negative=recheck)
     except Exception as e:
-        print(f"Ошибка проверки подписки для {user_id}: {e}")
+        logger.warning(f"Ошибка проверки подписки для {user_id}: {e}", extra={"user_id": user_id})
         return False
\ No newline at end of file
@@ -0,0 +1,161 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import signal
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 2.0
+
+_leader_lock_fd: Optional[int] = None
+
+def acquire_leader_lock(path: str) -> bool:
+    """
+    Выбор лидера среди воркеров через flock: лок держится до конца жизни процесса.
+    Лидер один раз регистрирует webhook и продолжает фоновые задачи.
+    """
+    global _leader_lock_fd
+    if _leader_lock_fd is not None:
+        return True
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _leader_lock_fd = fd
+    return True
+
+class WorkerRegistry:
+    """Heartbeat-файлы воркеров в общей папке — из них собираются /health и /ready"""
+
+    def __init__(self, state_dir: str, worker_id: int, expected: int):
+        self.state_dir = state_dir
+        self.worker_id = worker_id
+        self.expected = expected
+        self.ready = False
+        self.is_leader = False
+        self._path = os.path.join(state_dir, f"worker-{worker_id}.json")
+        # Дополнительные действия на каждый heartbeat (например, снимок метрик)
+        self.on_beat: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _write(self):
+        payload = {
+            "worker_id": self.worker_id,
+            "pid": os.getpid(),
+            "leader": self.is_leader,
+            "ready": self.ready,
+            "heartbeat": time.time(),
+        }
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self._path)
+
+    async def _beat_forever(self):
+        while True:
+            try:
+                self._write()
+                for callback in self.on_beat:
+                    callback()
+            except OSError as e:
+                logger.error(f"Ошибка записи heartbeat воркера {self.worker_id}: {e}")
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def start(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        self._write()
+        self._task = asyncio.create_task(self._beat_forever())
+
+    def mark_ready(self):
+        self.ready = True
+        self._write()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    def snapshot(self) -> List[Dict]:
+        """Состояние всех воркеров; alive — heartbeat не старше трёх интервалов"""
+        workers = []
+        now = time.time()
+        for name in sorted(os.listdir(self.state_dir)):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, name)) as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            info["alive"] = now - info["heartbeat"] < HEARTBEAT_INTERVAL * 3
+            workers.append(info)
+        return workers
+
+    def health(self) -> Dict:
+        workers = self.snapshot()
+        alive = [w for w in workers if w["alive"]]
+        return {
+            "expected": self.expected,
+            "alive": len(alive),
+            "ready": sum(1 for w in alive if w["ready"]),
+            "workers": workers,
+        }
+
+def serve_workers(count: int, target: Callable[[int], None], state_dir: str):
+    """
+    Мастер-процесс: запускает count воркеров (fork), пересоздаёт упавшие
+    и пересылает им SIGTERM/SIGINT при остановке.
+    """
+    import multiprocessing
+    
+    os.makedirs(state_dir, exist_ok=True)
+    for name in os.listdir(state_dir):
+        if name.startswith("worker-"):
+            os.remove(os.path.join(state_dir, name))
+
+    context = multiprocessing.get_context("fork")
+    processes: Dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def spawn(worker_id: int):
+        process = context.Process(target=target, args=(worker_id,), name=f"worker-{worker_id}")
+        process.start()
+        processes[worker_id] = process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker_id in range(count):
+        spawn(worker_id)
+
+    while processes:
+        time.sleep(0.5)
+        for worker_id, process in list(processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            if stopping:
+                del processes[worker_id]
+            else:
+                logger.warning(f"Воркер {worker_id} завершился с кодом {process.exitcode}, перезапуск")
+                spawn(worker_id)